@@ -3,306 +3,1010 @@ API для работы с чатами и сообщениями
 Получение списка чатов, отправка сообщений, создание чатов
 """
 import json
+import math
 import os
-from datetime import datetime
+import select
+import threading
+import time
+from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import hashlib
-import hmac
+from psycopg2.extras import execute_values
 import base64
+import hashlib
+from tokens import verify_jwt
+from responses import json_response, error_response, empty_response, preflight_response, gzip_response
+from instrumentation import start_request, open_cursor, explain_slow_queries, log_exception, finish_request
+from throttling import take_token, coalesce
+from database import PRIMARY, REPLICA, PRIMARY_UNTIL_HEADER, get_db_connection, release_db_connection, connection_role, read_role, primary_until
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
-
-def verify_jwt(token: str):
-    try:
-        secret = os.environ['JWT_SECRET']
-        parts = token.split('.')
-        if len(parts) != 3:
-            return None
-        
-        header, payload, signature = parts
-        expected_signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
-        expected_signature_b64 = base64.urlsafe_b64encode(expected_signature).decode().rstrip('=')
-        
-        if signature != expected_signature_b64:
-            return None
-        
-        payload_data = json.loads(base64.urlsafe_b64decode(payload + '=='))
-        if payload_data['exp'] < int(datetime.utcnow().timestamp()):
-            return None
-        
-        return payload_data
-    except:
-        return None
+def get_header(event, name: str) -> str:
+    headers = event.get('headers') or {}
+    return headers.get(name) or headers.get(name.lower()) or ''
 
 def get_user_from_token(event):
-    auth_header = event.get('headers', {}).get('authorization', '') or event.get('headers', {}).get('Authorization', '')
+    auth_header = get_header(event, 'Authorization')
     if not auth_header.startswith('Bearer '):
         return None
     
     token = auth_header.replace('Bearer ', '')
     return verify_jwt(token)
 
-def handler(event, context):
-    method = event.get('httpMethod', 'GET')
-    path = event.get('queryStringParameters', {}).get('path', '')
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20] + '"'
+
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match, X-Primary-Until'
+}
+
+ROUTES = {}
+PREFIX_ROUTES = {}
+
+def route(method: str, path: str, read_only: bool = False, sticky: bool = True, polling: bool = False):
+    def decorator(func):
+        func.read_only = read_only
+        func.polling = polling
+        func.sticky = sticky and method == 'POST'
+        if path.endswith('/'):
+            PREFIX_ROUTES[(method, path[:-1])] = func
+        else:
+            ROUTES[(method, path)] = func
+        return func
+    return decorator
+
+def resolve_route(method: str, path: str):
+    func = ROUTES.get((method, path))
+    if func:
+        return func, None
+    prefix, _, path_arg = path.partition('/')
+    return PREFIX_ROUTES.get((method, prefix)), path_arg
+
+class Request:
+    __slots__ = ('event', 'params', 'path', 'path_arg', 'user_id', 'body', 'conn', 'cur')
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    def __init__(self, event, params, path, path_arg, user_id, body, conn, cur):
+        self.event = event
+        self.params = params
+        self.path = path
+        self.path_arg = path_arg
+        self.user_id = user_id
+        self.body = body
+        self.conn = conn
+        self.cur = cur
+
+MESSAGE_COLUMNS = """
+    m.id, m.text, m.message_type, m.media_url, m.media_name, m.media_size,
+    m.is_edited, m.is_forwarded, m.reply_to_id, m.created_at,
+    m.sender_id, u.first_name, u.last_name, u.username, u.avatar_url
+"""
+
+SYNC_MESSAGES_LIMIT = 500
+LISTEN_TIMEOUT_SECONDS = 25
+SEND_BATCH_MAX_SIZE = 5000
+MESSAGE_TYPES = ('text', 'photo', 'video', 'file', 'voice', 'sticker')
+CHAT_PREVIEW_LENGTH = 200
+MESSAGE_CLOCK_SKEW = '5 minutes'
+MESSAGE_EDIT_SYNC_WINDOW = '7 days'
+SYNC_OVERLAP_SECONDS = 5
+PRESENCE_TTL_SECONDS = float(os.environ.get('PRESENCE_TTL_SECONDS', '60'))
+PRESENCE_FLUSH_SECONDS = float(os.environ.get('PRESENCE_FLUSH_SECONDS', '5'))
+PRESENCE_FLUSH_MAX_USERS = 1000
+PRESENCE_QUERY_MAX_USERS = 200
+SEARCH_MIN_LENGTH = 2
+SEARCH_TRIGRAM_MIN_LENGTH = 3
+SEARCH_LIMIT = 20
+SEARCH_COLUMNS = "id, username, first_name, last_name, avatar_url, bio"
+
+_pending_heartbeats = {}
+_heartbeats_pending_since = 0.0
+_heartbeats_lock = threading.Lock()
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def fetch_chats(cur, user_id: int, updated_since=None):
+    cur.execute("""
+        SELECT 
+            c.id, c.type, c.name, c.username, c.description, c.avatar_url, c.updated_at,
+            cm.is_pinned, cm.is_muted,
+            COALESCE(cs.members_count, 0) as members,
+            cm.unread_count,
+            CASE WHEN c.type = 'private' THEN (
+                SELECT peer.user_id FROM chat_members peer
+                WHERE peer.chat_id = c.id AND peer.user_id != cm.user_id
+                LIMIT 1
+            ) END as peer_id,
+            CASE WHEN cs.last_message_id IS NULL THEN NULL ELSE json_build_object(
+                'id', cs.last_message_id,
+                'text', cs.last_message_text,
+                'created_at', cs.last_message_at,
+                'sender_id', cs.last_message_sender_id,
+                'first_name', cs.last_message_first_name,
+                'last_name', cs.last_message_last_name
+            ) END as last_message
+        FROM chat_members cm
+        JOIN chats c ON c.id = cm.chat_id
+        LEFT JOIN chat_summary cs ON cs.chat_id = c.id
+        WHERE cm.user_id = %s AND (%s::timestamp IS NULL OR c.updated_at > %s)
+        ORDER BY c.updated_at DESC
+    """, (user_id, updated_since, updated_since))
     
-    user_payload = get_user_from_token(event)
-    if not user_payload:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Unauthorized'}),
-            'isBase64Encoded': False
-        }
+    return cur.fetchall()
+
+def fetch_messages_after(cur, chat_id: int, after_id: int, since, limit: int):
+    cur.execute(f"""
+        SELECT {MESSAGE_COLUMNS}
+        FROM messages m
+        JOIN users u ON u.id = m.sender_id
+        WHERE m.chat_id = %s AND m.id > %s AND m.created_at >= %s::timestamp - %s::interval
+        ORDER BY m.id ASC
+        LIMIT %s
+    """, (chat_id, after_id, since, MESSAGE_CLOCK_SKEW, limit))
+    return cur.fetchall()
+
+def chat_channel(chat_id: int) -> str:
+    return f'chat_{int(chat_id)}'
+
+def wait_for_notify(conn, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if select.select([conn], [], [], remaining) == ([], [], []):
+            return False
+        conn.poll()
+        if conn.notifies:
+            conn.notifies.clear()
+            return True
+
+def attach_reactions(cur, user_id: int, messages_list):
+    reactions_by_message = {msg['id']: [] for msg in messages_list}
+    if reactions_by_message:
+        cur.execute("""
+            SELECT r.message_id, r.emoji, COUNT(*) as count, 
+                   BOOL_OR(r.user_id = %s) as selected
+            FROM reactions r
+            WHERE r.message_id = ANY(%s)
+            GROUP BY r.message_id, r.emoji
+            ORDER BY r.message_id, MIN(r.id)
+        """, (user_id, list(reactions_by_message.keys())))
+        for reaction in cur.fetchall():
+            reactions_by_message[reaction['message_id']].append({
+                'emoji': reaction['emoji'],
+                'count': reaction['count'],
+                'selected': reaction['selected']
+            })
     
-    user_id = user_payload['user_id']
+    for msg in messages_list:
+        msg['reactions'] = reactions_by_message[msg['id']]
+
+def add_chat_members(cur, chat_id: int, member_ids, exclude_user_id: int):
+    cur.execute("""
+        INSERT INTO chat_members (chat_id, user_id, role, unread_count)
+        SELECT %(chat_id)s, u.id, 'member', total.count - COALESCE(sent.count, 0)
+        FROM users u
+        CROSS JOIN (SELECT COUNT(*) as count FROM messages WHERE chat_id = %(chat_id)s) total
+        LEFT JOIN (
+            SELECT sender_id, COUNT(*) as count FROM messages
+            WHERE chat_id = %(chat_id)s AND sender_id = ANY(%(member_ids)s)
+            GROUP BY sender_id
+        ) sent ON sent.sender_id = u.id
+        WHERE u.id = ANY(%(member_ids)s) AND u.id != %(exclude_user_id)s
+        ON CONFLICT (chat_id, user_id) DO NOTHING
+        RETURNING user_id
+    """, {
+        'chat_id': chat_id,
+        'member_ids': list({int(member_id) for member_id in member_ids}),
+        'exclude_user_id': exclude_user_id
+    })
+    return [row['user_id'] for row in cur.fetchall()]
+
+def update_chat_summary_last_messages(cur, sender_id: int, messages_list):
+    last_by_chat = {}
+    for message in messages_list:
+        if message['id'] > last_by_chat.get(message['chat_id'], {'id': 0})['id']:
+            last_by_chat[message['chat_id']] = message
     
+    last_messages = list(last_by_chat.values())
+    cur.execute("""
+        UPDATE chat_summary cs SET
+            last_message_id = t.message_id,
+            last_message_text = LEFT(t.text, %s),
+            last_message_sender_id = u.id,
+            last_message_first_name = u.first_name,
+            last_message_last_name = u.last_name,
+            last_message_at = t.created_at
+        FROM unnest(%s::integer[], %s::integer[], %s::text[], %s::timestamp[]) AS t(chat_id, message_id, text, created_at),
+            users u
+        WHERE cs.chat_id = t.chat_id AND u.id = %s
+        AND (cs.last_message_id IS NULL OR cs.last_message_id < t.message_id)
+    """, (
+        CHAT_PREVIEW_LENGTH,
+        [message['chat_id'] for message in last_messages],
+        [message['id'] for message in last_messages],
+        [message['text'] for message in last_messages],
+        [message['created_at'] for message in last_messages],
+        sender_id
+    ))
+
+def rebuild_chat_summary(cur, chat_id=None) -> int:
+    cur.execute("""
+        INSERT INTO chat_summary (
+            chat_id, last_message_id, last_message_text, last_message_sender_id,
+            last_message_first_name, last_message_last_name, last_message_at, members_count
+        )
+        SELECT
+            c.id, lm.id, LEFT(lm.text, %s), lm.sender_id,
+            lm.first_name, lm.last_name, lm.created_at, COALESCE(mc.members_count, 0)
+        FROM chats c
+        LEFT JOIN (
+            SELECT chat_id, COUNT(*) as members_count
+            FROM chat_members
+            GROUP BY chat_id
+        ) mc ON mc.chat_id = c.id
+        LEFT JOIN LATERAL (
+            SELECT m.id, m.text, m.created_at, m.sender_id, u.first_name, u.last_name
+            FROM messages m
+            JOIN users u ON u.id = m.sender_id
+            WHERE m.chat_id = c.id
+            ORDER BY m.id DESC
+            LIMIT 1
+        ) lm ON TRUE
+        WHERE %s::integer IS NULL OR c.id = %s
+        ON CONFLICT (chat_id) DO UPDATE SET
+            last_message_id = EXCLUDED.last_message_id,
+            last_message_text = EXCLUDED.last_message_text,
+            last_message_sender_id = EXCLUDED.last_message_sender_id,
+            last_message_first_name = EXCLUDED.last_message_first_name,
+            last_message_last_name = EXCLUDED.last_message_last_name,
+            last_message_at = EXCLUDED.last_message_at,
+            members_count = EXCLUDED.members_count
+    """, (CHAT_PREVIEW_LENGTH, chat_id, chat_id))
+    return cur.rowcount
+
+def reconcile_unread_counts(cur, user_id=None) -> int:
+    cur.execute("""
+        UPDATE chat_members cm
+        SET unread_count = counts.unread_count
+        FROM (
+            SELECT cm2.id, COUNT(m.id) as unread_count
+            FROM chat_members cm2
+            LEFT JOIN read_messages rm ON rm.chat_id = cm2.chat_id AND rm.user_id = cm2.user_id
+            LEFT JOIN messages m ON m.chat_id = cm2.chat_id AND m.sender_id != cm2.user_id
+                AND (rm.last_read_message_id IS NULL OR m.id > rm.last_read_message_id)
+            WHERE %s::integer IS NULL OR cm2.user_id = %s
+            GROUP BY cm2.id
+        ) counts
+        WHERE cm.id = counts.id AND cm.unread_count != counts.unread_count
+    """, (user_id, user_id))
+    return cur.rowcount
+
+def encode_sync_cursor(chats_updated_at: datetime, last_message_id: int, messages_updated_at: datetime) -> str:
+    raw = json.dumps({
+        'c': chats_updated_at.isoformat(),
+        'm': last_message_id,
+        'u': messages_updated_at.isoformat()
+    })
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor: str):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=='))
+        return (
+            datetime.fromisoformat(data['c']),
+            int(data['m']),
+            datetime.fromisoformat(data['u'])
+        )
+    except Exception:
+        return None
+
+def parse_created_at(value):
+    if not value:
+        return None
+    try:
+        created_at = datetime.fromisoformat(value)
+    except ValueError:
+        created_at = None
+    if created_at is None or created_at.tzinfo is not None:
+        raise ValueError(f'Invalid message timestamp: {value}')
+    return created_at
+
+def current_sync_cursor(cur) -> str:
+    cur.execute("""
+        SELECT LEAST(LOCALTIMESTAMP, pg_last_xact_replay_timestamp()::timestamp) as now,
+               COALESCE(MAX(last_message_id), 0) as last_message_id
+        FROM chat_summary
+    """)
+    row = cur.fetchone()
+    return encode_sync_cursor(row['now'], row['last_message_id'], row['now'])
+
+@route('GET', 'chats', read_only=True, polling=True)
+def get_chats(request):
+    user_id, cur = request.user_id, request.cur
+    
+    if request.params.get('cursor'):
+        cursor = current_sync_cursor(cur)
+        return json_response(200, {'chats': fetch_chats(cur, user_id), 'cursor': cursor})
+    
+    cur.execute("""
+        SELECT MAX(c.updated_at) as updated_at, COUNT(*) as chats_count,
+               COALESCE(SUM(cm.unread_count), 0) as unread_total,
+               BOOL_OR(cm.is_pinned) as any_pinned, SUM(cm.is_muted::integer) as muted_count
+        FROM chat_members cm
+        JOIN chats c ON c.id = cm.chat_id
+        WHERE cm.user_id = %s
+    """, (user_id,))
+    etag = make_etag(user_id, request.path, *cur.fetchone().values())
+    if get_header(request.event, 'If-None-Match') == etag:
+        return empty_response(304, {'ETag': etag})
+    
+    chats_with_messages = fetch_chats(cur, user_id)
+    
+    return json_response(200, {'chats': chats_with_messages}, {'ETag': etag})
+
+@route('GET', 'messages/', read_only=True, polling=True)
+def get_messages(request):
+    user_id, cur = request.user_id, request.cur
+    
+    chat_id = int(request.path_arg)
+    params = request.params
+    limit = int(params.get('limit', '50'))
+    before_id = params.get('before_id')
+    after_id = params.get('after_id')
+    
+    if before_id and after_id:
+        return error_response(400, 'Use either before_id or after_id')
+    
+    try:
+        before_created_at = parse_created_at(params.get('before_created_at'))
+        after_created_at = parse_created_at(params.get('after_created_at'))
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    if after_id:
+        page_filter, order, offset = "m.id > %(page_id)s", "ASC", 0
+    elif before_id:
+        page_filter, order, offset = "m.id < %(page_id)s", "DESC", 0
+    else:
+        page_filter, order, offset = "TRUE", "DESC", int(params.get('offset', '0'))
+    page = {
+        'chat_id': chat_id, 'page_id': int(after_id or before_id or 0), 'limit': limit, 'offset': offset,
+        'after_created_at': after_created_at, 'before_created_at': None if after_id else before_created_at,
+        'skew': MESSAGE_CLOCK_SKEW
+    }
+    if page['before_created_at']:
+        version_filter = "m.created_at <= %(before_created_at)s::timestamp + %(skew)s::interval"
+    else:
+        version_filter = "m.created_at >= GREATEST(c.created_at, %(after_created_at)s::timestamp) - %(skew)s::interval"
+    
+    cur.execute(f"""
+        SELECT c.updated_at, rv.reactions_version, rv.reactions_count,
+               GREATEST(c.created_at, %(after_created_at)s::timestamp) as lower
+        FROM chat_members cm
+        JOIN chats c ON c.id = cm.chat_id
+        CROSS JOIN LATERAL (
+            SELECT MAX(r.id) as reactions_version, COUNT(r.id) as reactions_count
+            FROM (
+                SELECT m.id FROM messages m
+                WHERE m.chat_id = %(chat_id)s AND {page_filter} AND {version_filter}
+                ORDER BY m.id {order}
+                LIMIT %(limit)s OFFSET %(offset)s
+            ) page
+            JOIN reactions r ON r.message_id = page.id
+        ) rv
+        WHERE cm.chat_id = %(chat_id)s AND cm.user_id = %(user_id)s
+    """, dict(page, user_id=user_id))
+    chat = cur.fetchone()
+    if not chat:
+        return error_response(403, 'Access denied')
+    
+    page_filter += " AND m.created_at >= %(lower)s::timestamp - %(skew)s::interval"
+    if page['before_created_at']:
+        page_filter += " AND m.created_at <= %(before_created_at)s::timestamp + %(skew)s::interval"
+    page['lower'] = chat['lower']
+    
+    etag = make_etag(user_id, request.path, limit, params.get('offset'), before_id, after_id, before_created_at, after_created_at,
+                     chat['updated_at'], chat['reactions_version'], chat['reactions_count'])
+    if get_header(request.event, 'If-None-Match') == etag:
+        return empty_response(304, {'ETag': etag})
+    
+    cur.execute(f"""
+        SELECT {MESSAGE_COLUMNS}
+        FROM messages m
+        JOIN users u ON u.id = m.sender_id
+        WHERE m.chat_id = %(chat_id)s AND {page_filter}
+        ORDER BY m.id {order}
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, page)
+    messages_list = cur.fetchall()
+    if order == "DESC":
+        messages_list.reverse()
+    
+    attach_reactions(cur, user_id, messages_list)
+    
+    return json_response(200, {'messages': messages_list}, {'ETag': etag})
+
+@route('GET', 'sync', polling=True)
+def get_sync(request):
+    user_id, cur = request.user_id, request.cur
+    
+    since = request.params.get('since', '')
+    
+    if not since:
+        return json_response(200, {'chats': [], 'messages': [], 'cursor': current_sync_cursor(cur)})
+    
+    decoded = decode_sync_cursor(since)
+    if not decoded:
+        return error_response(400, 'Invalid sync cursor')
+    
+    chats_since, last_message_id, messages_since = decoded
+    overlap = timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    
+    cur.execute("""
+        SELECT
+            LOCALTIMESTAMP as now,
+            EXISTS (
+                SELECT 1
+                FROM chat_members cm
+                JOIN chat_summary cs ON cs.chat_id = cm.chat_id
+                WHERE cm.user_id = %s AND cs.last_message_id > %s
+            ) as has_new,
+            EXISTS (
+                SELECT 1 FROM messages
+                WHERE id <= %s AND updated_at > %s AND created_at >= %s::timestamp - %s::interval
+            ) as has_edits
+    """, (user_id, last_message_id, last_message_id, messages_since - overlap, messages_since, MESSAGE_EDIT_SYNC_WINDOW))
+    changes = cur.fetchone()
+    
+    conditions = []
+    if changes['has_new']:
+        conditions.append("m.id > %(last_message_id)s AND m.created_at >= %(since)s::timestamp - %(skew)s::interval")
+    if changes['has_edits']:
+        conditions.append("m.id <= %(last_message_id)s AND m.updated_at > %(overlap_since)s"
+                          " AND m.created_at >= %(since)s::timestamp - %(edit_window)s::interval")
+    
+    messages_list = []
+    if conditions:
+        cur.execute(' UNION ALL '.join(f"""
+            SELECT {MESSAGE_COLUMNS}, m.chat_id, m.updated_at
+            FROM messages m
+            JOIN chat_members cm ON cm.chat_id = m.chat_id AND cm.user_id = %(user_id)s
+            JOIN users u ON u.id = m.sender_id
+            WHERE {condition}
+        """ for condition in conditions) + ' ORDER BY id ASC LIMIT %(limit)s', {
+            'user_id': user_id,
+            'last_message_id': last_message_id,
+            'since': messages_since,
+            'overlap_since': messages_since - overlap,
+            'skew': MESSAGE_CLOCK_SKEW,
+            'edit_window': MESSAGE_EDIT_SYNC_WINDOW,
+            'limit': SYNC_MESSAGES_LIMIT + 1
+        })
+        messages_list = cur.fetchall()
+    
+    if len(messages_list) > SYNC_MESSAGES_LIMIT:
+        return json_response(200, {'reset': True, 'cursor': current_sync_cursor(cur)})
+    
+    chats = fetch_chats(cur, user_id, chats_since - overlap)
+    
+    if not chats and not messages_list:
+        return empty_response(204)
+    
+    attach_reactions(cur, user_id, messages_list)
+    
+    next_cursor = encode_sync_cursor(
+        max(chats_since, changes['now']),
+        max([last_message_id] + [msg['id'] for msg in messages_list]),
+        max(messages_since, changes['now'])
+    )
+    
+    return json_response(200, {'chats': chats, 'messages': messages_list, 'cursor': next_cursor})
+
+@route('GET', 'listen/')
+def listen_messages(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    chat_id = int(request.path_arg)
+    params = request.params
+    after_id = int(params.get('after_id', '0'))
+    timeout = min(float(params.get('timeout', LISTEN_TIMEOUT_SECONDS)), LISTEN_TIMEOUT_SECONDS)
+    try:
+        after_created_at = parse_created_at(params.get('after_created_at'))
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    cur.execute("""
+        SELECT c.created_at
+        FROM chat_members cm
+        JOIN chats c ON c.id = cm.chat_id
+        WHERE cm.chat_id = %s AND cm.user_id = %s
+    """, (chat_id, user_id))
+    chat = cur.fetchone()
+    if not chat:
+        return error_response(403, 'Access denied')
+    since = max(chat['created_at'], after_created_at or chat['created_at'])
+    
+    conn.commit()
+    conn.autocommit = True
+    cur.execute(f"LISTEN {chat_channel(chat_id)}")
+    try:
+        messages_list = fetch_messages_after(cur, chat_id, after_id, since, SYNC_MESSAGES_LIMIT)
+        if not messages_list and wait_for_notify(conn, timeout):
+            messages_list = fetch_messages_after(cur, chat_id, after_id, since, SYNC_MESSAGES_LIMIT)
+    finally:
+        conn.notifies.clear()
+        try:
+            cur.execute("UNLISTEN *")
+        except psycopg2.Error:
+            conn.close()
+    
+    if not messages_list:
+        return empty_response(204)
+    
+    attach_reactions(cur, user_id, messages_list)
+    
+    return json_response(200, {'messages': messages_list})
+
+@route('POST', 'send')
+def send_message(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    body = request.body
+    chat_id = body.get('chat_id')
+    text = body.get('text', '').strip()
+    message_type = body.get('message_type', 'text')
+    
+    if not chat_id or not text:
+        return error_response(400, 'chat_id and text are required')
+    
+    cur.execute("SELECT 1 FROM chat_members WHERE chat_id = %s AND user_id = %s", (chat_id, user_id))
+    if not cur.fetchone():
+        return error_response(403, 'Access denied')
+    
+    cur.execute("UPDATE chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (chat_id,))
+    cur.execute("""
+        INSERT INTO messages (chat_id, sender_id, text, message_type)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id, chat_id, sender_id, text, message_type, created_at
+    """, (chat_id, user_id, text, message_type))
+    message = cur.fetchone()
+    
+    cur.execute("""
+        UPDATE chat_members SET unread_count = unread_count + 1
+        WHERE chat_id = %s AND user_id != %s
+    """, (chat_id, user_id))
+    update_chat_summary_last_messages(cur, user_id, [message])
+    cur.execute("SELECT pg_notify(%s, %s)", (chat_channel(chat_id), str(message['id'])))
+    conn.commit()
+    
+    return json_response(200, {'message': message})
+
+@route('POST', 'send-batch')
+def send_messages_batch(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    body = request.body
+    items = body.get('messages', [])
+    
+    if not isinstance(items, list) or not items or len(items) > SEND_BATCH_MAX_SIZE:
+        return error_response(400, f'messages must be a list of 1-{SEND_BATCH_MAX_SIZE} items')
+    
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        chat_id, text = item.get('chat_id'), item.get('text')
+        message_type = item.get('message_type', 'text')
         
-        if method == 'GET' and path == 'chats':
-            cur.execute("""
-                SELECT 
-                    c.id, c.type, c.name, c.username, c.description, c.avatar_url,
-                    cm.is_pinned, cm.is_muted,
-                    (SELECT COUNT(*) FROM chat_members WHERE chat_id = c.id) as members_count,
-                    (SELECT COUNT(*) FROM messages m 
-                     LEFT JOIN read_messages rm ON rm.chat_id = c.id AND rm.user_id = %s
-                     WHERE m.chat_id = c.id AND m.sender_id != %s 
-                     AND (rm.last_read_message_id IS NULL OR m.id > rm.last_read_message_id)
-                    ) as unread_count
-                FROM chats c
-                JOIN chat_members cm ON cm.chat_id = c.id
-                WHERE cm.user_id = %s
-                ORDER BY c.updated_at DESC
-            """, (user_id, user_id, user_id))
-            
-            chats = cur.fetchall()
-            
-            chats_with_messages = []
-            for chat in chats:
-                cur.execute("""
-                    SELECT m.id, m.text, m.created_at, m.sender_id, u.first_name, u.last_name
-                    FROM messages m
-                    JOIN users u ON u.id = m.sender_id
-                    WHERE m.chat_id = %s
-                    ORDER BY m.created_at DESC
-                    LIMIT 1
-                """, (chat['id'],))
-                last_message = cur.fetchone()
-                
-                chat_dict = dict(chat)
-                chat_dict['last_message'] = dict(last_message) if last_message else None
-                chat_dict['members'] = chat_dict.pop('members_count')
-                chats_with_messages.append(chat_dict)
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'chats': chats_with_messages}),
-                'isBase64Encoded': False
-            }
+        if not chat_id or not isinstance(text, str) or not text.strip():
+            error = 'chat_id and text are required'
+        elif isinstance(chat_id, bool) or not (isinstance(chat_id, int) or isinstance(chat_id, str) and chat_id.isdecimal()):
+            error = 'chat_id must be an integer'
+        elif not isinstance(message_type, str) or message_type not in MESSAGE_TYPES:
+            error = 'Invalid message_type'
+        else:
+            pending.append((index, int(chat_id), text.strip(), message_type))
+            continue
+        results[index] = {'index': index, 'error': error}
+    
+    if pending:
+        cur.execute("""
+            SELECT chat_id FROM chat_members
+            WHERE user_id = %s AND chat_id = ANY(%s)
+        """, (user_id, list({chat_id for _, chat_id, _, _ in pending})))
+        member_chat_ids = {row['chat_id'] for row in cur.fetchall()}
         
-        elif method == 'GET' and path.startswith('messages/'):
-            chat_id = int(path.split('/')[-1])
-            
-            cur.execute("SELECT 1 FROM chat_members WHERE chat_id = %s AND user_id = %s", (chat_id, user_id))
-            if not cur.fetchone():
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Access denied'}),
-                    'isBase64Encoded': False
-                }
-            
-            limit = int(event.get('queryStringParameters', {}).get('limit', '50'))
-            offset = int(event.get('queryStringParameters', {}).get('offset', '0'))
-            
-            cur.execute("""
-                SELECT 
-                    m.id, m.text, m.message_type, m.media_url, m.media_name, m.media_size,
-                    m.is_edited, m.is_forwarded, m.reply_to_id, m.created_at,
-                    m.sender_id, u.first_name, u.last_name, u.username, u.avatar_url
-                FROM messages m
-                JOIN users u ON u.id = m.sender_id
-                WHERE m.chat_id = %s
-                ORDER BY m.created_at DESC
-                LIMIT %s OFFSET %s
-            """, (chat_id, limit, offset))
-            
-            messages = cur.fetchall()
-            messages_list = [dict(msg) for msg in reversed(messages)]
-            
-            for msg in messages_list:
-                cur.execute("""
-                    SELECT r.emoji, COUNT(*) as count, 
-                           BOOL_OR(r.user_id = %s) as selected
-                    FROM reactions r
-                    WHERE r.message_id = %s
-                    GROUP BY r.emoji
-                """, (user_id, msg['id']))
-                reactions = cur.fetchall()
-                msg['reactions'] = [dict(r) for r in reactions]
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'messages': messages_list}),
-                'isBase64Encoded': False
-            }
+        allowed = []
+        for index, chat_id, text, message_type in pending:
+            if chat_id in member_chat_ids:
+                allowed.append((index, chat_id, text, message_type))
+            else:
+                results[index] = {'index': index, 'error': 'Access denied'}
         
-        elif method == 'POST' and path == 'send':
-            body = json.loads(event.get('body', '{}'))
-            chat_id = body.get('chat_id')
-            text = body.get('text', '').strip()
-            message_type = body.get('message_type', 'text')
-            
-            if not chat_id or not text:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'chat_id and text are required'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute("SELECT 1 FROM chat_members WHERE chat_id = %s AND user_id = %s", (chat_id, user_id))
-            if not cur.fetchone():
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Access denied'}),
-                    'isBase64Encoded': False
-                }
-            
+        if allowed:
+            chat_ids = sorted({chat_id for _, chat_id, _, _ in allowed})
             cur.execute("""
+                UPDATE chats c SET updated_at = CURRENT_TIMESTAMP
+                FROM (SELECT id FROM chats WHERE id = ANY(%s) ORDER BY id FOR UPDATE) locked
+                WHERE c.id = locked.id
+            """, (chat_ids,))
+            inserted = execute_values(cur, """
                 INSERT INTO messages (chat_id, sender_id, text, message_type)
-                VALUES (%s, %s, %s, %s)
+                VALUES %s
                 RETURNING id, chat_id, sender_id, text, message_type, created_at
-            """, (chat_id, user_id, text, message_type))
-            message = cur.fetchone()
-            
-            cur.execute("UPDATE chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (chat_id,))
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': dict(message)}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST' and path == 'create-chat':
-            body = json.loads(event.get('body', '{}'))
-            chat_type = body.get('type', 'private')
-            name = body.get('name', '').strip()
-            username = body.get('username', '').strip().lower()
-            member_ids = body.get('member_ids', [])
+            """, [(chat_id, user_id, text, message_type) for _, chat_id, text, message_type in allowed],
+                page_size=len(allowed), fetch=True)
             
-            if chat_type in ['group', 'channel'] and not name:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Name is required for groups and channels'}),
-                    'isBase64Encoded': False
-                }
-            
-            if username:
-                cur.execute("SELECT id FROM chats WHERE username = %s", (username,))
-                if cur.fetchone():
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Username already exists'}),
-                        'isBase64Encoded': False
-                    }
-            
-            cur.execute("""
-                INSERT INTO chats (type, name, username, created_by)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, type, name, username, created_at
-            """, (chat_type, name if name else None, username if username else None, user_id))
-            chat = cur.fetchone()
+            touched = {}
+            for (index, chat_id, _, _), message in zip(allowed, inserted):
+                results[index] = {'index': index, 'message': message}
+                touched[chat_id] = touched.get(chat_id, 0) + 1
             
             cur.execute("""
-                INSERT INTO chat_members (chat_id, user_id, role)
-                VALUES (%s, %s, 'owner')
-            """, (chat['id'], user_id))
-            
-            for member_id in member_ids:
-                if member_id != user_id:
-                    cur.execute("""
-                        INSERT INTO chat_members (chat_id, user_id, role)
-                        VALUES (%s, %s, 'member')
-                    """, (chat['id'], member_id))
-            
+                UPDATE chat_members cm SET unread_count = cm.unread_count + t.sent
+                FROM unnest(%s::integer[], %s::integer[]) AS t(chat_id, sent)
+                WHERE cm.chat_id = t.chat_id AND cm.user_id != %s
+            """, (chat_ids, [touched[chat_id] for chat_id in chat_ids], user_id))
+            update_chat_summary_last_messages(cur, user_id, inserted)
+            cur.execute("SELECT pg_notify('chat_' || chat_id, '') FROM unnest(%s::integer[]) AS chat_id", (chat_ids,))
             conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'chat': dict(chat)}),
-                'isBase64Encoded': False
-            }
+    
+    return json_response(200, {'results': results})
+
+@route('POST', 'read')
+def mark_read(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    body = request.body
+    chat_id = body.get('chat_id')
+    message_id = body.get('message_id')
+    
+    if not chat_id:
+        return error_response(400, 'chat_id is required')
+    if message_id is not None and (isinstance(message_id, bool) or not (
+            isinstance(message_id, int) and message_id > 0 or isinstance(message_id, str) and message_id.isdecimal())):
+        return error_response(400, 'message_id must be a positive integer')
+    
+    try:
+        message_created_at = parse_created_at(body.get('message_created_at'))
+    except ValueError as e:
+        return error_response(400, str(e))
+    
+    cur.execute("""
+        SELECT c.created_at FROM chat_members cm
+        JOIN chats c ON c.id = cm.chat_id
+        WHERE cm.chat_id = %s AND cm.user_id = %s
+        FOR SHARE OF c
+    """, (chat_id, user_id))
+    chat = cur.fetchone()
+    if not chat:
+        return error_response(403, 'Access denied')
+    
+    cur.execute("SELECT last_message_id FROM chat_summary WHERE chat_id = %s", (chat_id,))
+    summary = cur.fetchone()
+    last_message_id = summary['last_message_id'] if summary else None
+    if message_id is None or last_message_id is None:
+        message_id = last_message_id
+    else:
+        message_id = min(int(message_id), last_message_id)
+    
+    if message_id is not None:
+        cur.execute("""
+            INSERT INTO read_messages (user_id, chat_id, last_read_message_id)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, chat_id) DO UPDATE
+            SET last_read_message_id = GREATEST(read_messages.last_read_message_id, EXCLUDED.last_read_message_id),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING last_read_message_id
+        """, (user_id, chat_id, message_id))
+        last_read_message_id = cur.fetchone()['last_read_message_id']
         
-        elif method == 'GET' and path == 'search-users':
-            query = event.get('queryStringParameters', {}).get('q', '').strip().lower()
-            
-            if len(query) < 2:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Query must be at least 2 characters'}),
-                    'isBase64Encoded': False
-                }
-            
+        if last_message_id is not None and last_read_message_id >= last_message_id:
             cur.execute("""
-                SELECT id, username, first_name, last_name, avatar_url, bio
-                FROM users
-                WHERE username LIKE %s OR LOWER(first_name) LIKE %s OR LOWER(last_name) LIKE %s
-                LIMIT 20
-            """, (f'%{query}%', f'%{query}%', f'%{query}%'))
-            
-            users = cur.fetchall()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'users': [dict(u) for u in users]}),
-                'isBase64Encoded': False
-            }
-        
+                UPDATE chat_members SET unread_count = 0
+                WHERE chat_id = %s AND user_id = %s
+                RETURNING unread_count
+            """, (chat_id, user_id))
         else:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Not found'}),
-                'isBase64Encoded': False
-            }
+            cur.execute("""
+                UPDATE chat_members SET unread_count = (
+                    SELECT COUNT(*) FROM messages
+                    WHERE chat_id = %(chat_id)s AND sender_id != %(user_id)s AND id > %(read_id)s
+                    AND created_at >= %(since)s::timestamp - %(skew)s::interval
+                )
+                WHERE chat_id = %(chat_id)s AND user_id = %(user_id)s
+                RETURNING unread_count
+            """, {
+                'chat_id': chat_id,
+                'user_id': user_id,
+                'read_id': last_read_message_id,
+                'since': max(chat['created_at'], message_created_at or chat['created_at']),
+                'skew': MESSAGE_CLOCK_SKEW
+            })
+        unread_count = cur.fetchone()['unread_count']
+        conn.commit()
+    else:
+        last_read_message_id = None
+        unread_count = 0
+    
+    return json_response(200, {'last_read_message_id': last_read_message_id, 'unread_count': unread_count})
+
+@route('POST', 'create-chat')
+def create_chat(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    body = request.body
+    chat_type = body.get('type', 'private')
+    name = body.get('name', '').strip()
+    username = body.get('username', '').strip().lower()
+    member_ids = body.get('member_ids', [])
+    
+    if chat_type in ['group', 'channel'] and not name:
+        return error_response(400, 'Name is required for groups and channels')
+    
+    if username:
+        cur.execute("SELECT id FROM chats WHERE username = %s", (username,))
+        if cur.fetchone():
+            return error_response(400, 'Username already exists')
+    
+    cur.execute("""
+        INSERT INTO chats (type, name, username, created_by)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id, type, name, username, created_at
+    """, (chat_type, name if name else None, username if username else None, user_id))
+    chat = cur.fetchone()
+    
+    cur.execute("""
+        INSERT INTO chat_members (chat_id, user_id, role)
+        VALUES (%s, %s, 'owner')
+    """, (chat['id'], user_id))
+    
+    added_ids = add_chat_members(cur, chat['id'], member_ids, user_id)
+    cur.execute("""
+        INSERT INTO chat_summary (chat_id, members_count)
+        VALUES (%s, %s)
+    """, (chat['id'], len(added_ids) + 1))
+    
+    conn.commit()
     
+    return json_response(200, {'chat': chat})
+
+@route('POST', 'add-members')
+def add_members(request):
+    user_id, conn, cur = request.user_id, request.conn, request.cur
+    
+    body = request.body
+    chat_id = body.get('chat_id')
+    member_ids = body.get('member_ids', [])
+    
+    if not chat_id or not isinstance(member_ids, list) or not member_ids:
+        return error_response(400, 'chat_id and member_ids are required')
+    
+    cur.execute("""
+        SELECT c.type, cm.role FROM chats c
+        JOIN chat_members cm ON cm.chat_id = c.id
+        WHERE c.id = %s AND cm.user_id = %s
+        FOR UPDATE OF c
+    """, (chat_id, user_id))
+    membership = cur.fetchone()
+    if not membership or membership['role'] not in ('owner', 'admin'):
+        return error_response(403, 'Access denied')
+    
+    if membership['type'] == 'private':
+        return error_response(400, 'Cannot add members to a private chat')
+    
+    added_ids = add_chat_members(cur, chat_id, member_ids, user_id)
+    if added_ids:
+        cur.execute("UPDATE chats SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (chat_id,))
+        cur.execute("""
+            UPDATE chat_summary SET members_count = members_count + %s
+            WHERE chat_id = %s
+        """, (len(added_ids), chat_id))
+    conn.commit()
+    
+    return json_response(200, {'added': added_ids})
+
+@route('GET', 'search-users', read_only=True)
+def search_users(request):
+    cur = request.cur
+    
+    query = request.params.get('q', '').strip().lower()
+    
+    if len(query) < SEARCH_MIN_LENGTH:
+        return error_response(400, f'Query must be at least {SEARCH_MIN_LENGTH} characters')
+    
+    pattern = escape_like(query)
+    if len(query) < SEARCH_TRIGRAM_MIN_LENGTH:
+        cur.execute(f"""
+            SELECT {SEARCH_COLUMNS}
+            FROM (
+                SELECT DISTINCT ON (id) *
+                FROM (
+                    (SELECT {SEARCH_COLUMNS}, 0 as rank FROM users
+                     WHERE username COLLATE "C" LIKE %(prefix)s
+                     ORDER BY username COLLATE "C" LIMIT %(limit)s)
+                    UNION ALL
+                    (SELECT {SEARCH_COLUMNS}, 1 as rank FROM users
+                     WHERE LOWER(first_name) COLLATE "C" LIKE %(prefix)s
+                     ORDER BY LOWER(first_name) COLLATE "C" LIMIT %(limit)s)
+                    UNION ALL
+                    (SELECT {SEARCH_COLUMNS}, 1 as rank FROM users
+                     WHERE LOWER(last_name) COLLATE "C" LIKE %(prefix)s
+                     ORDER BY LOWER(last_name) COLLATE "C" LIMIT %(limit)s)
+                ) candidates
+                ORDER BY id, rank
+            ) matches
+            ORDER BY rank, username
+            LIMIT %(limit)s
+        """, {'prefix': f'{pattern}%', 'limit': SEARCH_LIMIT})
+    else:
+        cur.execute(f"""
+            SELECT {SEARCH_COLUMNS}
+            FROM users
+            WHERE search_name LIKE %s
+            ORDER BY
+                username LIKE %s DESC,
+                (LOWER(first_name) LIKE %s OR LOWER(last_name) LIKE %s) DESC,
+                similarity(search_name, %s) DESC,
+                username
+            LIMIT %s
+        """, (f'%{pattern}%', f'{pattern}%', f'{pattern}%', f'{pattern}%', query, SEARCH_LIMIT))
+    
+    users = cur.fetchall()
+    
+    return json_response(200, {'users': users})
+
+def heartbeats_due(now: float) -> bool:
+    if not _pending_heartbeats:
+        return False
+    return len(_pending_heartbeats) >= PRESENCE_FLUSH_MAX_USERS or now - _heartbeats_pending_since >= PRESENCE_FLUSH_SECONDS
+
+def record_heartbeats(heartbeats: dict):
+    global _heartbeats_pending_since
+    with _heartbeats_lock:
+        if not _pending_heartbeats:
+            _heartbeats_pending_since = min(heartbeats.values())
+        for user_id, seen_at in heartbeats.items():
+            _pending_heartbeats[user_id] = max(seen_at, _pending_heartbeats.get(user_id, seen_at))
+
+def flush_heartbeats(cur) -> int:
+    global _pending_heartbeats
+    with _heartbeats_lock:
+        pending, _pending_heartbeats = _pending_heartbeats, {}
+    flushed_at = time.monotonic()
+    if not pending:
+        return 0
+    
+    user_ids = sorted(pending)
+    try:
+        cur.execute("""
+            INSERT INTO user_presence (user_id, last_seen)
+            SELECT t.user_id, LOCALTIMESTAMP - make_interval(secs => t.age)
+            FROM unnest(%s::integer[], %s::float8[]) AS t(user_id, age)
+            ON CONFLICT (user_id) DO UPDATE
+            SET last_seen = GREATEST(user_presence.last_seen, EXCLUDED.last_seen)
+        """, (user_ids, [flushed_at - pending[user_id] for user_id in user_ids]))
+    except psycopg2.Error:
+        record_heartbeats(pending)
+        raise
+    return len(user_ids)
+
+def flush_due_heartbeats(conn):
+    if conn.closed or connection_role(conn) != PRIMARY or not heartbeats_due(time.monotonic()):
+        return
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            flush_heartbeats(cur)
+        conn.commit()
+    except psycopg2.Error as e:
+        log_exception('heartbeat flush', e)
+
+@route('POST', 'heartbeat', sticky=False)
+def heartbeat(request):
+    now = time.monotonic()
+    record_heartbeats({request.user_id: now})
+    
+    if heartbeats_due(now):
+        flush_heartbeats(request.cur)
+        request.conn.commit()
+    
+    return empty_response(204)
+
+@route('GET', 'presence')
+def get_presence(request):
+    user_id, cur = request.user_id, request.cur
+    
+    try:
+        user_ids = sorted({int(user_id) for user_id in request.params.get('user_ids', '').split(',') if user_id})
+    except ValueError:
+        return error_response(400, 'user_ids must be a comma-separated list of integers')
+    
+    if not user_ids or len(user_ids) > PRESENCE_QUERY_MAX_USERS:
+        return error_response(400, f'user_ids must list 1-{PRESENCE_QUERY_MAX_USERS} users')
+    
+    cur.execute("""
+        SELECT u.id as user_id,
+               COALESCE(p.last_seen, u.last_seen) as last_seen,
+               COALESCE(p.last_seen > LOCALTIMESTAMP - make_interval(secs => %s), FALSE) as online
+        FROM users u
+        LEFT JOIN user_presence p ON p.user_id = u.id
+        WHERE u.id = ANY(%s) AND (u.id = %s OR EXISTS (
+            SELECT 1 FROM chat_members mine
+            JOIN chat_members theirs ON theirs.chat_id = mine.chat_id
+            WHERE mine.user_id = %s AND theirs.user_id = u.id
+        ))
+    """, (PRESENCE_TTL_SECONDS, user_ids, user_id, user_id))
+    
+    return json_response(200, {'presence': cur.fetchall()})
+
+def execute_route(route_handler, event, params, path, path_arg, user_id, body, stats):
+    try:
+        role = read_role(get_header(event, PRIMARY_UNTIL_HEADER)) if route_handler.read_only else PRIMARY
+        conn = get_db_connection(role)
+        cur = open_cursor(conn, stats)
+        try:
+            response = route_handler(Request(event, params, path, path_arg, user_id, body, conn, cur))
+        except psycopg2.OperationalError:
+            if connection_role(conn) != REPLICA:
+                raise
+            replica_conn, replica_cur = conn, cur
+            conn = get_db_connection(PRIMARY)
+            replica_cur.close()
+            release_db_connection(replica_conn)
+            cur = open_cursor(conn, stats)
+            response = route_handler(Request(event, params, path, path_arg, user_id, body, conn, cur))
+        if route_handler.sticky and response['statusCode'] < 300:
+            response['headers'] = {**response['headers'], PRIMARY_UNTIL_HEADER: primary_until()}
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception(f"{event.get('httpMethod', 'GET')} {route_handler.__name__}", e)
+        response = error_response(500, str(e))
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            explain_slow_queries(stats, conn)
+            flush_due_heartbeats(conn)
+            release_db_connection(conn)
+    
+    return response
+
+def handler(event, context):
+    method = event.get('httpMethod', 'GET')
+    params = event.get('queryStringParameters') or {}
+    path = params.get('path', '')
+    
+    if method == 'OPTIONS':
+        return preflight_response(PREFLIGHT_HEADERS)
+    
+    user_payload = get_user_from_token(event)
+    if not user_payload:
+        return error_response(401, 'Unauthorized')
+    
+    route_handler, path_arg = resolve_route(method, path)
+    if not route_handler:
+        return error_response(404, 'Not found')
+    
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return error_response(400, 'Invalid JSON body')
+    if not isinstance(body, dict):
+        return error_response(400, 'Invalid JSON body')
+    
+    user_id = user_payload['user_id']
+    stats = start_request(f'{method} {route_handler.__name__}')
+    if not route_handler.polling:
+        response = execute_route(route_handler, event, params, path, path_arg, user_id, body, stats)
+    else:
+        retry_after = take_token(f'{user_id}:{route_handler.__name__}')
+        if retry_after:
+            response = error_response(429, 'Too many requests', {'Retry-After': str(math.ceil(retry_after))})
+        else:
+            key = (user_id, path, tuple(sorted(params.items())),
+                   get_header(event, 'If-None-Match'), get_header(event, PRIMARY_UNTIL_HEADER))
+            response = coalesce(key, execute_route, route_handler, event, params, path, path_arg, user_id, body, stats)
+    
+    return gzip_response(finish_request(stats, response), get_header(event, 'Accept-Encoding'))
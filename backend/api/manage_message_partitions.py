@@ -0,0 +1,108 @@
+"""
+Обслуживание помесячных секций таблицы messages
+create создаёт секции на несколько месяцев вперёд, archive отсоединяет старые секции и переносит их в схему archive
+"""
+import re
+import sys
+from datetime import date
+from psycopg2.extras import RealDictCursor
+from index import get_db_connection, release_db_connection
+
+PARTITION_MONTHS_AHEAD = 3
+ARCHIVE_KEEP_MONTHS = 12
+ARCHIVE_SCHEMA = 'archive'
+PARTITION_NAME = re.compile(r'^messages_(\d{4})_(\d{2})$')
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f'messages_{month:%Y_%m}'
+
+def list_partitions(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'messages'::regclass
+    """)
+    partitions = {}
+    for row in cur.fetchall():
+        match = PARTITION_NAME.match(row['relname'])
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = row['relname']
+    return dict(sorted(partitions.items()))
+
+def create_partitions(cur, first_month: date, last_month: date):
+    existing = list_partitions(cur)
+    created = []
+    month = date(first_month.year, first_month.month, 1)
+    while month <= last_month:
+        if month not in existing:
+            cur.execute(f"""
+                CREATE TABLE {partition_name(month)} PARTITION OF messages
+                FOR VALUES FROM (%s) TO (%s)
+            """, (month, add_months(month, 1)))
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+def archive_partition(cur, month: date, name: str):
+    bounds = (month, add_months(month, 1))
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.reactions (LIKE reactions)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM reactions
+            WHERE message_created_at >= %s AND message_created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {ARCHIVE_SCHEMA}.reactions SELECT * FROM moved
+    """, bounds)
+    moved_reactions = cur.rowcount
+    cur.execute("""
+        UPDATE messages SET reply_to_created_at = NULL
+        WHERE reply_to_created_at >= %s AND reply_to_created_at < %s
+    """, bounds)
+    cur.execute(f"ALTER TABLE messages DETACH PARTITION {name}")
+    cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+    return moved_reactions
+
+def default_partition_rows(cur) -> int:
+    cur.execute("SELECT COUNT(*) as count FROM messages_default")
+    return cur.fetchone()['count']
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command not in ('create', 'archive'):
+        print('Usage: manage_message_partitions.py create [months_ahead] | archive [keep_months]')
+        sys.exit(1)
+    
+    this_month = date.today().replace(day=1)
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        if command == 'create':
+            months_ahead = int(sys.argv[2]) if len(sys.argv) > 2 else PARTITION_MONTHS_AHEAD
+            created = create_partitions(cur, this_month, add_months(this_month, months_ahead))
+            conn.commit()
+            print(f'Created partitions: {", ".join(created) or "none"}')
+            stray_rows = default_partition_rows(cur)
+            if stray_rows:
+                print(f'Warning: messages_default holds {stray_rows} rows, move them before creating their partitions')
+        else:
+            keep_months = int(sys.argv[2]) if len(sys.argv) > 2 else ARCHIVE_KEEP_MONTHS
+            cutoff = add_months(this_month, -keep_months)
+            for month, name in list_partitions(cur).items():
+                if month >= cutoff:
+                    continue
+                moved_reactions = archive_partition(cur, month, name)
+                conn.commit()
+                print(f'Archived {name} to {ARCHIVE_SCHEMA}.{name} with {moved_reactions} reactions')
+        cur.close()
+    finally:
+        release_db_connection(conn)
+
+if __name__ == '__main__':
+    main()
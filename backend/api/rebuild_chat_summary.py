@@ -0,0 +1,22 @@
+"""
+Полная пересборка таблицы chat_summary из messages и chat_members
+Можно передать chat_id, чтобы пересобрать сводку только одного чата
+"""
+import sys
+from psycopg2.extras import RealDictCursor
+from index import get_db_connection, release_db_connection, rebuild_chat_summary
+
+def main():
+    chat_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        rebuilt = rebuild_chat_summary(cur, chat_id)
+        conn.commit()
+        cur.close()
+        print(f'Rebuilt chat summaries: {rebuilt}')
+    finally:
+        release_db_connection(conn)
+
+if __name__ == '__main__':
+    main()
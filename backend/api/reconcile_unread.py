@@ -0,0 +1,22 @@
+"""
+Пересчёт денормализованных счётчиков непрочитанных сообщений
+Сверяет chat_members.unread_count с read_messages и messages, исправляет расхождения
+"""
+import sys
+from psycopg2.extras import RealDictCursor
+from index import get_db_connection, release_db_connection, reconcile_unread_counts
+
+def main():
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        fixed = reconcile_unread_counts(cur, user_id)
+        conn.commit()
+        cur.close()
+        print(f'Fixed unread counters: {fixed}')
+    finally:
+        release_db_connection(conn)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Ограничение частоты опросов (token bucket по пользователю) и объединение одинаковых одновременных запросов
+Корзины хранятся в памяти процесса или, при RATE_LIMIT_STORE=database, в общей нежурналируемой таблице
+"""
+import os
+import threading
+import time
+import psycopg2
+from database import get_db_connection, release_db_connection
+
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_PER_SECOND = float(os.environ.get('RATE_LIMIT_PER_SECOND', '1'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '10'))
+RATE_LIMIT_MAX_BUCKETS = 10000
+COALESCE_WAIT_SECONDS = 30
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_flights = {}
+_flights_lock = threading.Lock()
+
+def prune_buckets(now: float):
+    refill_seconds = RATE_LIMIT_BURST / RATE_LIMIT_PER_SECOND
+    for key, (_, updated) in list(_buckets.items()):
+        if now - updated >= refill_seconds:
+            del _buckets[key]
+
+def take_token_in_memory(key: str) -> float:
+    now = time.monotonic()
+    with _buckets_lock:
+        if len(_buckets) >= RATE_LIMIT_MAX_BUCKETS:
+            prune_buckets(now)
+        tokens, updated = _buckets.get(key, (RATE_LIMIT_BURST, now))
+        tokens = min(RATE_LIMIT_BURST, tokens + (now - updated) * RATE_LIMIT_PER_SECOND)
+        if tokens >= 1:
+            _buckets[key] = (tokens - 1, now)
+            return 0.0
+        _buckets[key] = (tokens, now)
+        return (1 - tokens) / RATE_LIMIT_PER_SECOND
+
+def take_token_in_database(cur, key: str) -> float:
+    refill = "LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM LOCALTIMESTAMP - b.updated_at) * %(rate)s)"
+    cur.execute(f"""
+        INSERT INTO rate_limit_buckets AS b (bucket_key, tokens, allowed, updated_at)
+        VALUES (%(key)s, %(burst)s - 1, TRUE, LOCALTIMESTAMP)
+        ON CONFLICT (bucket_key) DO UPDATE SET
+            allowed = {refill} >= 1,
+            tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END,
+            updated_at = LOCALTIMESTAMP
+        RETURNING allowed, tokens
+    """, {'key': key, 'burst': RATE_LIMIT_BURST, 'rate': RATE_LIMIT_PER_SECOND})
+    allowed, tokens = cur.fetchone()
+    return 0.0 if allowed else (1 - tokens) / RATE_LIMIT_PER_SECOND
+
+def take_token(key: str) -> float:
+    if RATE_LIMIT_STORE != 'database':
+        return take_token_in_memory(key)
+    
+    try:
+        conn = get_db_connection()
+    except psycopg2.Error:
+        return take_token_in_memory(key)
+    try:
+        with conn.cursor() as cur:
+            retry_after = take_token_in_database(cur, key)
+        conn.commit()
+        return retry_after
+    except psycopg2.Error:
+        return take_token_in_memory(key)
+    finally:
+        release_db_connection(conn)
+
+class Flight:
+    __slots__ = ('done', 'response')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+
+def copy_response(response: dict) -> dict:
+    return {**response, 'headers': dict(response['headers'])}
+
+def coalesce(key, func, *args):
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    
+    if not leader:
+        if flight.done.wait(COALESCE_WAIT_SECONDS) and flight.response is not None:
+            return copy_response(flight.response)
+        return func(*args)
+    
+    try:
+        flight.response = func(*args)
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return copy_response(flight.response)
@@ -0,0 +1,82 @@
+"""
+Выпуск и проверка JWT-токенов
+Проверенные токены кэшируются по подписи, чтобы частые запросы не пересчитывали HMAC
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', '1024'))
+SIGNATURE_LENGTH = 43
+
+_verified_tokens = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def sign(signing_input: str) -> str:
+    secret = os.environ['JWT_SECRET']
+    return b64encode(hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest())
+
+def now_timestamp() -> int:
+    return int(datetime.utcnow().timestamp())
+
+def create_jwt(user_id: int, username: str) -> str:
+    exp = int((datetime.utcnow() + timedelta(days=30)).timestamp())
+    
+    header = b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = b64encode(json.dumps({"user_id": user_id, "username": username, "exp": exp}).encode())
+    
+    return f"{header}.{payload}.{sign(f'{header}.{payload}')}"
+
+def cached_payload(signature: str, signing_input: str, now: int):
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(signature)
+        if cached is None or not hmac.compare_digest(cached[0], signing_input):
+            return None
+        if cached[1]['exp'] < now:
+            del _verified_tokens[signature]
+            return None
+        _verified_tokens.move_to_end(signature)
+        return cached[1]
+
+def remember_token(signature: str, signing_input: str, payload_data: dict):
+    with _verified_tokens_lock:
+        _verified_tokens[signature] = (signing_input, payload_data)
+        while len(_verified_tokens) > JWT_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
+def verify_jwt(token: str):
+    try:
+        parts = token.split('.')
+        if len(parts) != 3:
+            return None
+        
+        header, payload, signature = parts
+        if len(signature) != SIGNATURE_LENGTH:
+            return None
+        
+        signing_input = f"{header}.{payload}"
+        now = now_timestamp()
+        
+        cached = cached_payload(signature, signing_input, now)
+        if cached is not None:
+            return cached
+        
+        if not hmac.compare_digest(signature, sign(signing_input)):
+            return None
+        
+        payload_data = json.loads(base64.urlsafe_b64decode(payload + '=='))
+        if payload_data['exp'] < now:
+            return None
+        
+        remember_token(signature, signing_input, payload_data)
+        return payload_data
+    except Exception:
+        return None
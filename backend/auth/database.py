@@ -0,0 +1,101 @@
+"""
+Пулы соединений с основной базой и необязательной репликой для чтения (DATABASE_READ_URL)
+Недоступная реплика на время выключается из маршрутизации, запросы идут в основную базу
+"""
+import os
+import time
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_HEALTHCHECK_IDLE_SECONDS = float(os.environ.get('DB_HEALTHCHECK_IDLE_SECONDS', '30'))
+REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', '30'))
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '5'))
+PRIMARY_UNTIL_HEADER = 'X-Primary-Until'
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+DATABASE_URL_VARIABLES = {PRIMARY: 'DATABASE_URL', REPLICA: 'DATABASE_READ_URL'}
+
+_db_pools = {}
+_db_last_used = {}
+_db_connection_roles = {}
+_replica_down_until = 0.0
+
+def get_db_pool(role: str = PRIMARY):
+    pool = _db_pools.get(role)
+    if pool is None or pool.closed:
+        pool = ThreadedConnectionPool(1, DB_POOL_MAX_SIZE, os.environ[DATABASE_URL_VARIABLES[role]])
+        _db_pools[role] = pool
+    return pool
+
+def is_connection_alive(conn) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - _db_last_used.get(id(conn), 0) < DB_HEALTHCHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def replica_available() -> bool:
+    return bool(os.environ.get('DATABASE_READ_URL')) and time.monotonic() >= _replica_down_until
+
+def mark_replica_down():
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+
+def checkout_connection(role: str):
+    pool = get_db_pool(role)
+    for _ in range(DB_POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        if is_connection_alive(conn):
+            _db_connection_roles[id(conn)] = role
+            if role == REPLICA and not conn.readonly:
+                conn.readonly = True
+            return conn
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def get_db_connection(role: str = PRIMARY):
+    if role == REPLICA and replica_available():
+        try:
+            return checkout_connection(REPLICA)
+        except psycopg2.OperationalError:
+            mark_replica_down()
+    return checkout_connection(PRIMARY)
+
+def release_db_connection(conn):
+    role = _db_connection_roles.pop(id(conn), PRIMARY)
+    pool = get_db_pool(role)
+    discard = bool(conn.closed)
+    if not discard:
+        try:
+            conn.rollback()
+            conn.autocommit = False
+        except psycopg2.Error:
+            discard = True
+    if discard:
+        _db_last_used.pop(id(conn), None)
+        if role == REPLICA:
+            mark_replica_down()
+    else:
+        _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn, close=discard)
+
+def connection_role(conn) -> str:
+    return _db_connection_roles.get(id(conn), PRIMARY)
+
+def read_role(primary_until: str) -> str:
+    try:
+        return PRIMARY if float(primary_until) > time.time() else REPLICA
+    except ValueError:
+        return REPLICA
+
+def primary_until() -> str:
+    return f'{time.time() + READ_YOUR_WRITES_SECONDS:.3f}'
@@ -7,236 +7,205 @@ import os
 import hashlib
 import hmac
 import base64
-from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from tokens import create_jwt, verify_jwt
+from responses import json_response, error_response, preflight_response
+from instrumentation import start_request, open_cursor, explain_slow_queries, log_exception, finish_request
+from database import PRIMARY, REPLICA, PRIMARY_UNTIL_HEADER, get_db_connection, release_db_connection, connection_role, read_role, primary_until
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+SCRYPT_N = int(os.environ.get('SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('SCRYPT_P', '1'))
+DUMMY_PASSWORD_HASH = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${base64.b64encode(bytes(16)).decode()}${base64.b64encode(bytes(32)).decode()}"
 
-def create_jwt(user_id: int, username: str) -> str:
-    secret = os.environ['JWT_SECRET']
-    exp = int((datetime.utcnow() + timedelta(days=30)).timestamp())
+def scrypt_digest(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=128 * r * (n + p + 2), dklen=32)
+
+def hash_password(password: str, n: int = None, r: int = None, p: int = None) -> str:
+    n, r, p = n or SCRYPT_N, r or SCRYPT_R, p or SCRYPT_P
+    salt = os.urandom(16)
+    digest = scrypt_digest(password, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+def verify_password(password: str, password_hash: str) -> bool:
+    if not password_hash.startswith('scrypt$'):
+        verify_password(password, DUMMY_PASSWORD_HASH)
+        legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, password_hash)
+    
+    try:
+        _, n, r, p, salt, digest = password_hash.split('$')
+        expected = scrypt_digest(password, base64.b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(expected, base64.b64decode(digest))
+    except ValueError:
+        return False
+
+def password_needs_rehash(password_hash: str) -> bool:
+    return not password_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Primary-Until'
+}
+
+ACTIONS = {}
+
+def action(name: str, read_only: bool = False):
+    def decorator(func):
+        func.read_only = read_only
+        ACTIONS[name] = func
+        return func
+    return decorator
+
+class Request:
+    __slots__ = ('event', 'body', 'conn', 'cur')
     
-    header = base64.urlsafe_b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode()).decode().rstrip('=')
-    payload = base64.urlsafe_b64encode(json.dumps({"user_id": user_id, "username": username, "exp": exp}).encode()).decode().rstrip('=')
+    def __init__(self, event, body, conn, cur):
+        self.event = event
+        self.body = body
+        self.conn = conn
+        self.cur = cur
+
+def get_header(event, name: str) -> str:
+    headers = event.get('headers') or {}
+    return headers.get(name) or headers.get(name.lower()) or ''
+
+@action('register')
+def register(request):
+    body, conn, cur = request.body, request.conn, request.cur
+    
+    username = body.get('username', '').strip().lower()
+    password = body.get('password', '')
+    first_name = body.get('first_name', '').strip()
+    last_name = body.get('last_name', '').strip()
+    phone = body.get('phone', '').strip()
+    
+    if not username or not password or not first_name:
+        return error_response(400, 'Username, password and first_name are required')
+    
+    if len(username) < 3 or len(username) > 32:
+        return error_response(400, 'Username must be 3-32 characters')
     
-    signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
-    signature_b64 = base64.urlsafe_b64encode(signature).decode().rstrip('=')
+    cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+    if cur.fetchone():
+        return error_response(400, 'Username already exists')
     
-    return f"{header}.{payload}.{signature_b64}"
+    password_hash = hash_password(password)
+    
+    cur.execute(
+        """INSERT INTO users (username, first_name, last_name, phone, password_hash) 
+           VALUES (%s, %s, %s, %s, %s) RETURNING id, username, first_name, last_name, phone, avatar_url, bio""",
+        (username, first_name, last_name if last_name else None, phone if phone else None, password_hash)
+    )
+    user = cur.fetchone()
+    conn.commit()
+    
+    token = create_jwt(user['id'], user['username'])
+    
+    return json_response(200, {'token': token, 'user': dict(user)})
 
-def verify_jwt(token: str):
-    try:
-        secret = os.environ['JWT_SECRET']
-        parts = token.split('.')
-        if len(parts) != 3:
-            return None
-        
-        header, payload, signature = parts
-        expected_signature = hmac.new(secret.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
-        expected_signature_b64 = base64.urlsafe_b64encode(expected_signature).decode().rstrip('=')
-        
-        if signature != expected_signature_b64:
-            return None
-        
-        payload_data = json.loads(base64.urlsafe_b64decode(payload + '=='))
-        if payload_data['exp'] < int(datetime.utcnow().timestamp()):
-            return None
-        
-        return payload_data
-    except:
-        return None
+@action('login')
+def login(request):
+    body, conn, cur = request.body, request.conn, request.cur
+    
+    username = body.get('username', '').strip().lower()
+    password = body.get('password', '')
+    
+    if not username or not password:
+        return error_response(400, 'Username and password are required')
+    
+    cur.execute(
+        "SELECT id, username, first_name, last_name, phone, avatar_url, bio, password_hash FROM users WHERE username = %s",
+        (username,)
+    )
+    user = cur.fetchone()
+    
+    if not user:
+        verify_password(password, DUMMY_PASSWORD_HASH)
+        return error_response(401, 'Invalid username or password')
+    
+    stored_hash = user.pop('password_hash')
+    if not verify_password(password, stored_hash):
+        return error_response(401, 'Invalid username or password')
+    
+    if password_needs_rehash(stored_hash):
+        cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (hash_password(password), user['id']))
+        conn.commit()
+    
+    token = create_jwt(user['id'], user['username'])
+    
+    return json_response(200, {'token': token, 'user': dict(user)})
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+@action('verify', read_only=True)
+def verify(request):
+    cur = request.cur
+    
+    auth_header = get_header(request.event, 'Authorization')
+    if not auth_header.startswith('Bearer '):
+        return error_response(401, 'No token provided')
+    
+    token = auth_header.replace('Bearer ', '')
+    payload = verify_jwt(token)
+    
+    if not payload:
+        return error_response(401, 'Invalid token')
+    
+    cur.execute(
+        "SELECT id, username, first_name, last_name, phone, avatar_url, bio FROM users WHERE id = %s",
+        (payload['user_id'],)
+    )
+    user = cur.fetchone()
+    
+    if not user:
+        return error_response(401, 'User not found')
+    
+    return json_response(200, {'user': dict(user)})
 
 def handler(event, context):
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return preflight_response(PREFLIGHT_HEADERS)
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return error_response(405, 'Method not allowed')
     
     try:
-        body = json.loads(event.get('body', '{}'))
-        action = body.get('action')
-        
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        if action == 'register':
-            username = body.get('username', '').strip().lower()
-            password = body.get('password', '')
-            first_name = body.get('first_name', '').strip()
-            last_name = body.get('last_name', '').strip()
-            phone = body.get('phone', '').strip()
-            
-            if not username or not password or not first_name:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Username, password and first_name are required'}),
-                    'isBase64Encoded': False
-                }
-            
-            if len(username) < 3 or len(username) > 32:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Username must be 3-32 characters'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-            if cur.fetchone():
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Username already exists'}),
-                    'isBase64Encoded': False
-                }
-            
-            password_hash = hash_password(password)
-            
-            cur.execute(
-                """INSERT INTO users (username, first_name, last_name, phone, password_hash, is_online) 
-                   VALUES (%s, %s, %s, %s, %s, TRUE) RETURNING id, username, first_name, last_name, phone, avatar_url, bio""",
-                (username, first_name, last_name if last_name else None, phone if phone else None, password_hash)
-            )
-            user = cur.fetchone()
-            conn.commit()
-            
-            token = create_jwt(user['id'], user['username'])
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'token': token,
-                    'user': dict(user)
-                }),
-                'isBase64Encoded': False
-            }
-        
-        elif action == 'login':
-            username = body.get('username', '').strip().lower()
-            password = body.get('password', '')
-            
-            if not username or not password:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Username and password are required'}),
-                    'isBase64Encoded': False
-                }
-            
-            password_hash = hash_password(password)
-            
-            cur.execute(
-                "SELECT id, username, first_name, last_name, phone, avatar_url, bio FROM users WHERE username = %s AND password_hash = %s",
-                (username, password_hash)
-            )
-            user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid username or password'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute("UPDATE users SET is_online = TRUE, last_seen = CURRENT_TIMESTAMP WHERE id = %s", (user['id'],))
-            conn.commit()
-            
-            token = create_jwt(user['id'], user['username'])
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'token': token,
-                    'user': dict(user)
-                }),
-                'isBase64Encoded': False
-            }
-        
-        elif action == 'verify':
-            auth_header = event.get('headers', {}).get('Authorization', '')
-            if not auth_header.startswith('Bearer '):
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'No token provided'}),
-                    'isBase64Encoded': False
-                }
-            
-            token = auth_header.replace('Bearer ', '')
-            payload = verify_jwt(token)
-            
-            if not payload:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid token'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute(
-                "SELECT id, username, first_name, last_name, phone, avatar_url, bio, is_online FROM users WHERE id = %s",
-                (payload['user_id'],)
-            )
-            user = cur.fetchone()
-            
-            if not user:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'User not found'}),
-                    'isBase64Encoded': False
-                }
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'user': dict(user)}),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid action'}),
-                'isBase64Encoded': False
-            }
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return error_response(400, 'Invalid JSON body')
+    
+    action_handler = ACTIONS.get(body.get('action')) if isinstance(body, dict) else None
+    if not action_handler:
+        return error_response(400, 'Invalid action')
     
+    stats = start_request(f'POST {action_handler.__name__}')
+    try:
+        role = read_role(get_header(event, PRIMARY_UNTIL_HEADER)) if action_handler.read_only else PRIMARY
+        conn = get_db_connection(role)
+        cur = open_cursor(conn, stats)
+        try:
+            response = action_handler(Request(event, body, conn, cur))
+        except psycopg2.OperationalError:
+            if connection_role(conn) != REPLICA:
+                raise
+            replica_conn, replica_cur = conn, cur
+            conn = get_db_connection(PRIMARY)
+            replica_cur.close()
+            release_db_connection(replica_conn)
+            cur = open_cursor(conn, stats)
+            response = action_handler(Request(event, body, conn, cur))
+        if not action_handler.read_only and response['statusCode'] < 300:
+            response['headers'] = {**response['headers'], PRIMARY_UNTIL_HEADER: primary_until()}
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        log_exception(f'POST {action_handler.__name__}', e)
+        response = error_response(500, str(e))
     finally:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
+            explain_slow_queries(stats, conn)
+            release_db_connection(conn)
+    
+    return finish_request(stats, response)
@@ -0,0 +1,115 @@
+"""
+Инструментирование обработчиков: время маршрута, число и длительность SQL-запросов
+Пишет структурированные логи, заголовок Server-Timing и EXPLAIN ANALYZE для медленных запросов
+"""
+import json
+import os
+import re
+import time
+import traceback
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+EXPLAIN_MAX_QUERIES = 3
+LOGGED_QUERY_LENGTH = 500
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+class RequestStats:
+    __slots__ = ('route', 'started', 'queries', 'db_ms', 'slow_queries')
+    
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_ms = 0.0
+        self.slow_queries = []
+    
+    def record(self, query, params, elapsed_ms: float):
+        statement = query.decode() if isinstance(query, bytes) else str(query)
+        self.queries.append(round(elapsed_ms, 2))
+        self.db_ms += elapsed_ms
+        if elapsed_ms >= SLOW_QUERY_MS:
+            self.slow_queries.append({'duration_ms': round(elapsed_ms, 2), 'statement': statement, 'params': params})
+
+class InstrumentedCursor(RealDictCursor):
+    stats = None
+    
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if self.stats is not None:
+                self.stats.record(query, vars, (time.perf_counter() - started) * 1000)
+
+def start_request(route: str):
+    return RequestStats(route) if INSTRUMENTATION_ENABLED else None
+
+def open_cursor(conn, stats):
+    if stats is None:
+        return conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor(cursor_factory=InstrumentedCursor)
+    cur.stats = stats
+    return cur
+
+def explain_slow_queries(stats, conn):
+    if stats is None or not stats.slow_queries or conn.closed:
+        return
+    
+    for slow_query in stats.slow_queries[:EXPLAIN_MAX_QUERIES]:
+        statement = slow_query['statement'].lstrip()
+        if not statement.upper().startswith(('SELECT', 'WITH')):
+            continue
+        try:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", slow_query['params'])
+                slow_query['plan'] = '\n'.join(row[0] for row in cur.fetchall())
+            conn.rollback()
+        except psycopg2.Error as e:
+            slow_query['plan_error'] = str(e)
+
+def redact(text):
+    return STRING_LITERAL.sub("'…'", text) if text else text
+
+def log_exception(route: str, error: Exception):
+    print(json.dumps({
+        'type': 'error',
+        'route': route,
+        'error': str(error),
+        'traceback': traceback.format_exc()
+    }), flush=True)
+
+def finish_request(stats, response: dict):
+    if stats is None:
+        return response
+    
+    duration_ms = (time.perf_counter() - stats.started) * 1000
+    response['headers'] = {
+        **response['headers'],
+        'Server-Timing': f'app;dur={duration_ms:.1f}, db;dur={stats.db_ms:.1f};desc="{len(stats.queries)} queries"'
+    }
+    
+    print(json.dumps({
+        'type': 'request',
+        'route': stats.route,
+        'status': response['statusCode'],
+        'duration_ms': round(duration_ms, 2),
+        'db_ms': round(stats.db_ms, 2),
+        'query_count': len(stats.queries),
+        'query_ms': stats.queries
+    }), flush=True)
+    
+    for slow_query in stats.slow_queries:
+        print(json.dumps({
+            'type': 'slow_query',
+            'route': stats.route,
+            'duration_ms': slow_query['duration_ms'],
+            'statement': redact(slow_query['statement'])[:LOGGED_QUERY_LENGTH],
+            'plan': redact(slow_query.get('plan')),
+            'plan_error': slow_query.get('plan_error')
+        }), flush=True)
+    
+    return response
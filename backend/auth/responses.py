@@ -0,0 +1,73 @@
+"""
+Общий слой HTTP-ответов облачных функций
+Готовые заголовки, компактный JSON (через orjson, если он установлен) и gzip для больших ответов
+"""
+import base64
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP_MIN_BYTES = 2048
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag, X-Primary-Until, Retry-After'
+}
+EMPTY_HEADERS = {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag, X-Primary-Until, Retry-After'}
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def to_json(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, default=json_default).decode()
+    return json.dumps(data, default=json_default, separators=(',', ':'), ensure_ascii=False)
+
+def json_response(status_code: int, data, headers: dict = None):
+    return {
+        'statusCode': status_code,
+        'headers': {**JSON_HEADERS, **headers} if headers else dict(JSON_HEADERS),
+        'body': to_json(data),
+        'isBase64Encoded': False
+    }
+
+def error_response(status_code: int, message: str, headers: dict = None):
+    return json_response(status_code, {'error': message}, headers)
+
+def empty_response(status_code: int, headers: dict = None):
+    return {
+        'statusCode': status_code,
+        'headers': {**EMPTY_HEADERS, **headers} if headers else dict(EMPTY_HEADERS),
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def preflight_response(preflight_headers: dict):
+    return {
+        'statusCode': 200,
+        'headers': dict(preflight_headers),
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def gzip_response(response: dict, accept_encoding: str):
+    body = response['body']
+    if 'gzip' not in accept_encoding or response['isBase64Encoded'] or len(body) < GZIP_MIN_BYTES:
+        return response
+    
+    compressed = gzip.compress(body.encode(), compresslevel=5)
+    response['headers'] = {**response['headers'], 'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(compressed).decode()
+    response['isBase64Encoded'] = True
+    return response
@@ -0,0 +1,36 @@
+"""
+Подбор параметров scrypt под целевое время хеширования на текущем хосте
+Выводит значения SCRYPT_N/SCRYPT_R/SCRYPT_P для переменных окружения функции
+"""
+import sys
+import time
+from index import scrypt_digest
+
+def measure(n: int, r: int, p: int, rounds: int = 5) -> float:
+    salt = b'0' * 16
+    started = time.perf_counter()
+    for _ in range(rounds):
+        scrypt_digest('benchmark-password', salt, n, r, p)
+    return (time.perf_counter() - started) / rounds * 1000
+
+def main():
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 50.0
+    r, p = 8, 1
+    n = 1024
+    
+    while True:
+        elapsed_ms = measure(n, r, p)
+        print(f'N={n} r={r} p={p}: {elapsed_ms:.1f} ms')
+        if elapsed_ms >= target_ms or n >= 2 ** 20:
+            break
+        n *= 2
+    
+    if elapsed_ms > target_ms * 1.5 and n > 1024:
+        n //= 2
+    
+    print(f'SCRYPT_N={n}')
+    print(f'SCRYPT_R={r}')
+    print(f'SCRYPT_P={p}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Бенчмарк списка чатов: как растёт задержка GET chats с числом чатов пользователя
+Сравнивает прежний N+1 запрос (отдельный запрос последнего сообщения на каждый чат) с текущим обработчиком
+"""
+import argparse
+import contextlib
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile, response_queries, timed
+from seed import seed
+
+LEGACY_CHATS_QUERY = """
+    SELECT
+        c.id, c.type, c.name, c.username, c.description, c.avatar_url,
+        cm.is_pinned, cm.is_muted,
+        (SELECT COUNT(*) FROM chat_members WHERE chat_id = c.id) as members_count,
+        (SELECT COUNT(*) FROM messages m
+         LEFT JOIN read_messages rm ON rm.chat_id = c.id AND rm.user_id = %s
+         WHERE m.chat_id = c.id AND m.sender_id != %s
+         AND (rm.last_read_message_id IS NULL OR m.id > rm.last_read_message_id)
+        ) as unread_count
+    FROM chats c
+    JOIN chat_members cm ON cm.chat_id = c.id
+    WHERE cm.user_id = %s
+    ORDER BY c.updated_at DESC
+"""
+LEGACY_LAST_MESSAGE_QUERY = """
+    SELECT m.id, m.text, m.created_at, m.sender_id, u.first_name, u.last_name
+    FROM messages m
+    JOIN users u ON u.id = m.sender_id
+    WHERE m.chat_id = %s
+    ORDER BY m.created_at DESC
+    LIMIT 1
+"""
+
+def legacy_chat_list(cur, user_id: int):
+    cur.execute(LEGACY_CHATS_QUERY, (user_id, user_id, user_id))
+    chats = [dict(chat) for chat in cur.fetchall()]
+    for chat in chats:
+        cur.execute(LEGACY_LAST_MESSAGE_QUERY, (chat['id'],))
+        chat['last_message'] = cur.fetchone()
+    return chats
+
+def join_chats(api, dsn: str, user_id: int, chat_count: int):
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO chat_members (chat_id, user_id, role)
+                SELECT id, %s, 'member' FROM chats WHERE id <= %s
+                ON CONFLICT (chat_id, user_id) DO NOTHING
+            """, (user_id, chat_count))
+            api.rebuild_chat_summary(cur)
+            api.reconcile_unread_counts(cur, user_id)
+        conn.commit()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark chat-list latency against the number of chats a user is in')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_chat_list_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--chat-counts', type=int, nargs='+', default=[10, 100, 300, 1000], help='Chats the measured user is in')
+    parser.add_argument('--messages', type=int, default=300000, help='Seeded messages')
+    parser.add_argument('--repeats', type=int, default=20, help='Measured requests per chat count')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': 2000, 'chats': max(args.chat_counts), 'members_per_chat': 4, 'messages': args.messages,
+             'months': 2, 'reaction_rate': 0, 'read_rate': 0.8}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (username, first_name, password_hash)
+                VALUES ('chatlistbench', 'Бенчмарк', 'benchmark')
+                RETURNING id
+            """)
+            user_id = cur.fetchone()[0]
+        conn.commit()
+    client = Client(user_id, tokens.create_jwt(user_id, 'chatlistbench'), [])
+    
+    print(f'{args.repeats} requests per row, {args.messages} messages in {max(args.chat_counts)} chats')
+    print(f"{'chats':>7}{'legacy p50':>12}{'p95':>9}{'queries':>9}{'current p50':>13}{'p95':>9}{'queries':>9}")
+    failed = False
+    with contextlib.closing(psycopg2.connect(database_dsn)) as legacy_conn:
+        legacy_cur = legacy_conn.cursor(cursor_factory=RealDictCursor)
+        for chat_count in sorted(args.chat_counts):
+            join_chats(api, database_dsn, user_id, chat_count)
+            
+            legacy_latencies, legacy_chats = timed(lambda: legacy_chat_list(legacy_cur, user_id), args.repeats)
+            legacy_conn.rollback()
+            latencies, response = timed(lambda: api.handler(make_event(client, 'GET', 'chats'), None), args.repeats)
+            
+            print(f"{chat_count:>7}{percentile(legacy_latencies, 0.5):>12.2f}{percentile(legacy_latencies, 0.95):>9.2f}"
+                  f"{len(legacy_chats) + 1:>9}{percentile(latencies, 0.5):>13.2f}{percentile(latencies, 0.95):>9.2f}"
+                  f"{response_queries(response):>9}")
+            
+            chats = decode_body(response).get('chats', []) if response['statusCode'] == 200 else []
+            if len(chats) != len(legacy_chats):
+                print(f"FAIL {chat_count} chats: handler returned {len(chats)} chats with status {response['statusCode']}, "
+                      f"legacy query returned {len(legacy_chats)}")
+                failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
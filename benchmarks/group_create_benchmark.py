@@ -0,0 +1,105 @@
+"""
+Бенчмарк создания группы: create-chat с 10, 1000 и 100000 участников против прежней вставки участников по одному
+Падает, если в созданной группе не все участники или число участников в chat_summary расходится с chat_members
+"""
+import argparse
+import contextlib
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile, timed
+from seed import seed_users
+
+def legacy_create_chat(conn, user_id: int, member_ids):
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            INSERT INTO chats (type, name, created_by)
+            VALUES ('group', 'Группа', %s)
+            RETURNING id
+        """, (user_id,))
+        chat_id = cur.fetchone()['id']
+        cur.execute("""
+            INSERT INTO chat_members (chat_id, user_id, role)
+            VALUES (%s, %s, 'owner')
+        """, (chat_id, user_id))
+        for member_id in member_ids:
+            if member_id != user_id:
+                cur.execute("""
+                    INSERT INTO chat_members (chat_id, user_id, role)
+                    VALUES (%s, %s, 'member')
+                """, (chat_id, member_id))
+    conn.commit()
+    return chat_id
+
+def check_chat(conn, chat_id: int, expected: int) -> list:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM chat_members WHERE chat_id = %(chat_id)s) as members,
+                   (SELECT members_count FROM chat_summary WHERE chat_id = %(chat_id)s) as summary
+        """, {'chat_id': chat_id})
+        row = cur.fetchone()
+    conn.commit()
+    failures = []
+    if row['members'] != expected:
+        failures.append(f"chat {chat_id} has {row['members']} members, expected {expected}")
+    if row['summary'] is not None and row['summary'] != row['members']:
+        failures.append(f"chat {chat_id} summary counts {row['summary']} members, chat_members has {row['members']}")
+    return failures
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark group creation latency against the number of members')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_group_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--members', type=int, nargs='+', default=[10, 1000, 100000], help='Group sizes to create')
+    parser.add_argument('--repeats', type=int, default=3, help='Groups created per size and mode')
+    parser.add_argument('--legacy-max-members', type=int, default=100000, help='Skip the per-member loop above this size')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, _ = load_api(database_dsn)
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor() as cur:
+            seed_users(cur, max(args.members) + 1)
+            cur.execute("ANALYZE users")
+        conn.commit()
+    owner = Client(1, tokens.create_jwt(1, 'user1'), [])
+    
+    print(f'{args.repeats} groups per row')
+    print(f"{'members':>8}  {'mode':<9}{'p50 ms':>10}{'max ms':>10}")
+    failed = False
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        for members in args.members:
+            member_ids = list(range(2, members + 2))
+            event = make_event(owner, 'POST', 'create-chat', body={'type': 'group', 'name': 'Группа', 'member_ids': member_ids})
+            rows = [('current', lambda: api.handler(event, None))]
+            if members <= args.legacy_max_members:
+                rows.append(('legacy', lambda: legacy_create_chat(conn, owner.user_id, member_ids)))
+            for mode, create in rows:
+                latencies, result = timed(create, args.repeats)
+                print(f"{members:>8}  {mode:<9}{percentile(latencies, 0.50):>10.1f}{latencies[-1]:>10.1f}")
+                if mode == 'current' and result['statusCode'] != 200:
+                    print(f"FAIL {members} members: create-chat returned {result['statusCode']}")
+                    failed = True
+                    continue
+                chat_id = decode_body(result)['chat']['id'] if mode == 'current' else result
+                for failure in check_chat(conn, chat_id, members + 1):
+                    print(f'FAIL {mode}: {failure}')
+                    failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Микробенчмарк накладных расходов handler без базы данных: маршрутизация, проверка JWT, сборка и сжатие ответа
+Соединение подменяется заглушкой с готовыми строками; каждый сценарий прогоняется с INSTRUMENTATION_ENABLED=0 и =1
+"""
+import argparse
+import contextlib
+import importlib
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from load_test import Client, load_api, make_event, percentile, timed
+
+STARTED_AT = datetime(2026, 1, 1, 12, 0, 0)
+INSTRUMENTATION_MODES = {'off': '0', 'on': '1'}
+
+class StubCursor:
+    stats = None
+    
+    def __init__(self, results):
+        self.results = results
+        self.rows = []
+    
+    def execute(self, query, params=None):
+        started = time.perf_counter()
+        self.rows = next((rows for fragment, rows in self.results if fragment in query), [])
+        if self.stats is not None:
+            self.stats.record(query, params, (time.perf_counter() - started) * 1000)
+    
+    def fetchone(self):
+        return dict(self.rows[0]) if self.rows else None
+    
+    def fetchall(self):
+        return [dict(row) for row in self.rows]
+    
+    def close(self):
+        pass
+
+class StubConnection:
+    closed = False
+    readonly = False
+    autocommit = False
+    notices = []
+    
+    def __init__(self, results):
+        self.results = results
+    
+    def cursor(self, cursor_factory=None):
+        return StubCursor(self.results)
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+
+def chat_rows(count: int):
+    return [{
+        'id': i, 'type': 'group', 'name': f'Чат {i}', 'username': None, 'description': None, 'avatar_url': None,
+        'updated_at': STARTED_AT + timedelta(minutes=i), 'is_pinned': False, 'is_muted': False, 'members': 8,
+        'unread_count': i % 5, 'peer_id': None,
+        'last_message': {'id': i * 10, 'text': 'Последнее сообщение', 'created_at': (STARTED_AT + timedelta(minutes=i)).isoformat(),
+                         'sender_id': 2, 'first_name': 'Мария', 'last_name': 'Иванова'}
+    } for i in range(1, count + 1)]
+
+def message_rows(count: int):
+    return [{
+        'id': i, 'text': f'Сообщение {i}', 'message_type': 'text', 'media_url': None, 'media_name': None, 'media_size': None,
+        'is_edited': False, 'is_forwarded': False, 'reply_to_id': None, 'created_at': STARTED_AT + timedelta(seconds=i),
+        'sender_id': 1 + i % 3, 'first_name': 'Иван', 'last_name': 'Петров', 'username': f'user{1 + i % 3}', 'avatar_url': None
+    } for i in range(1, count + 1)]
+
+def stub_results(rows: int):
+    return [
+        ('MAX(c.updated_at)', [{'updated_at': STARTED_AT, 'chats_count': rows, 'unread_total': 3, 'any_pinned': False, 'muted_count': 0}]),
+        ('json_build_object', chat_rows(rows)),
+        ('reactions_version', [{'updated_at': STARTED_AT, 'reactions_version': 7, 'reactions_count': 3, 'lower': STARTED_AT}]),
+        ('BOOL_OR(r.user_id', []),
+        ('FROM messages m', message_rows(rows))
+    ]
+
+@contextlib.contextmanager
+def stubbed_database(api, rows: int):
+    saved = api.get_db_connection, api.release_db_connection
+    connection = StubConnection(stub_results(rows))
+    api.get_db_connection = lambda role=None: connection
+    api.release_db_connection = lambda conn: None
+    try:
+        yield
+    finally:
+        api.get_db_connection, api.release_db_connection = saved
+
+@contextlib.contextmanager
+def instrumentation(enabled: str):
+    import instrumentation as module
+    saved = os.environ.get('INSTRUMENTATION_ENABLED', '')
+    os.environ['INSTRUMENTATION_ENABLED'] = enabled
+    importlib.reload(module)
+    try:
+        yield
+    finally:
+        os.environ['INSTRUMENTATION_ENABLED'] = saved
+        importlib.reload(module)
+
+def scenarios(api, client: Client):
+    anonymous = Client(0, 'invalid', [])
+    chats = make_event(client, 'GET', 'chats')
+    _, response = timed(lambda: api.handler(chats, None), 1)
+    not_modified = make_event(client, 'GET', 'chats', etag=response['headers']['ETag'])
+    return {
+        'preflight': {'httpMethod': 'OPTIONS', 'queryStringParameters': {'path': 'chats'}, 'headers': {}},
+        'unauthorized': make_event(anonymous, 'GET', 'chats'),
+        'not found': make_event(client, 'GET', 'no-such-route'),
+        'chats 304': not_modified,
+        'chats': chats,
+        'messages': make_event(client, 'GET', 'messages/1', {'limit': '50'})
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark handler overhead with a stubbed database connection')
+    parser.add_argument('--requests', type=int, default=5000, help='Measured calls per scenario')
+    parser.add_argument('--rows', type=int, default=50, help='Chats and messages returned by the stubbed queries')
+    parser.add_argument('--instrumentation', choices=['off', 'on', 'both'], default='both',
+                        help='Run with INSTRUMENTATION_ENABLED off, on, or both and report the difference')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    api, tokens, _ = load_api('dbname=stubbed')
+    client = Client(1, tokens.create_jwt(1, 'user1'), [1])
+    
+    modes = list(INSTRUMENTATION_MODES) if args.instrumentation == 'both' else [args.instrumentation]
+    print(f'{args.requests} calls per row, {args.rows} rows per stubbed query; overhead is the p50 difference from the off row')
+    print(f"{'scenario':<14}{'instr':<6}{'status':>7}{'p50 us':>9}{'p95 us':>9}{'calls/s':>10}{'overhead us':>13}")
+    failed = False
+    with stubbed_database(api, args.rows):
+        for name, event in scenarios(api, client).items():
+            baseline = None
+            for mode in modes:
+                with instrumentation(INSTRUMENTATION_MODES[mode]):
+                    latencies, response = timed(lambda: api.handler(event, None), args.requests)
+                p50 = percentile(latencies, 0.50) * 1000
+                overhead = f'{p50 - baseline:+.1f}' if baseline is not None else ''
+                baseline = p50 if mode == 'off' else baseline
+                print(f"{name:<14}{mode:<6}{response['statusCode']:>7}{p50:>9.1f}"
+                      f"{percentile(latencies, 0.95) * 1000:>9.1f}{len(latencies) / sum(latencies) * 1000:>10.0f}{overhead:>13}")
+                if response['statusCode'] >= 500:
+                    print(f"FAIL {name} ({mode}): handler returned {response['statusCode']}")
+                    failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Нагрузочный тест heartbeat: сравнивает пакетную запись присутствия с записью на каждый heartbeat и со старым UPDATE users
+Печатает пропускную способность, задержки, число запросов к БД и объём WAL на один heartbeat
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, percentile, response_queries
+from seed import seed_users
+
+LEGACY_MODE = 'users'
+
+def wal_position(cur) -> int:
+    cur.execute("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), '0/0')::bigint")
+    return cur.fetchone()[0]
+
+def run_api_heartbeats(api, clients, heartbeats: int, flush_seconds: float, rng):
+    api.PRESENCE_FLUSH_SECONDS = flush_seconds
+    latencies = []
+    queries = 0
+    failures = 0
+    
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(heartbeats):
+            event = make_event(rng.choice(clients), 'POST', 'heartbeat')
+            started = time.perf_counter()
+            response = api.handler(event, None)
+            latencies.append((time.perf_counter() - started) * 1000)
+            queries += response_queries(response)
+            failures += response['statusCode'] != 204
+        
+        conn = api.get_db_connection()
+        try:
+            api.flush_heartbeats(conn.cursor())
+            conn.commit()
+        finally:
+            api.release_db_connection(conn)
+    
+    return latencies, queries, failures
+
+def run_legacy_heartbeats(dsn: str, clients, heartbeats: int, rng):
+    latencies = []
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        for _ in range(heartbeats):
+            started = time.perf_counter()
+            cur.execute("UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE id = %s", (rng.choice(clients).user_id,))
+            conn.commit()
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        conn.close()
+    return latencies, heartbeats, 0
+
+def run_mode(mode, api, dsn: str, clients, heartbeats: int, rng) -> dict:
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("TRUNCATE user_presence")
+        wal_before = wal_position(cur)
+        
+        started = time.perf_counter()
+        if mode == LEGACY_MODE:
+            latencies, queries, failures = run_legacy_heartbeats(dsn, clients, heartbeats, rng)
+        else:
+            latencies, queries, failures = run_api_heartbeats(api, clients, heartbeats, mode, rng)
+        elapsed = time.perf_counter() - started
+        
+        wal_bytes = wal_position(cur) - wal_before
+    
+    latencies.sort()
+    return {
+        'mode': 'UPDATE users' if mode == LEGACY_MODE else f'flush every {mode:g} s',
+        'per_second': heartbeats / elapsed,
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries': queries / heartbeats,
+        'wal_bytes': wal_bytes / heartbeats,
+        'failures': failures
+    }
+
+def parse_mode(value: str):
+    return value if value == LEGACY_MODE else float(value)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark presence heartbeats against a local PostgreSQL')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_presence_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--users', type=int, default=10000, help='Seeded users')
+    parser.add_argument('--clients', type=int, default=2000, help='Users sending heartbeats')
+    parser.add_argument('--heartbeats', type=int, default=20000, help='Heartbeats per mode')
+    parser.add_argument('--modes', type=parse_mode, nargs='+', default=[0.0, 5.0, LEGACY_MODE],
+                        help=f'Flush intervals in seconds (0 writes every heartbeat) and/or "{LEGACY_MODE}" for the old UPDATE users')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the traffic generator')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor() as cur:
+            seed_users(cur, args.users)
+        conn.commit()
+    
+    api, tokens, _ = load_api(database_dsn)
+    rng = random.Random(args.seed)
+    clients = [Client(user_id, tokens.create_jwt(user_id, f'user{user_id}'), [])
+               for user_id in rng.sample(range(1, args.users + 1), min(args.clients, args.users))]
+    
+    print(f'{args.heartbeats} heartbeats per mode from {len(clients)} users')
+    print(f"{'mode':<20}{'per s':>10}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'WAL B':>9}")
+    failed = False
+    for mode in args.modes:
+        row = run_mode(mode, api, database_dsn, clients, args.heartbeats, rng)
+        print(f"{row['mode']:<20}{row['per_second']:>10.0f}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+              f"{row['queries']:>9.3f}{row['wal_bytes']:>9.0f}")
+        if row['failures']:
+            print(f"FAIL {row['mode']}: {row['failures']} heartbeats did not return 204")
+            failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Бенчмарк простаивающей сессии: клиент с открытым чатом опрашивает chats, messages и sync, пока другие пользователи ставят реакции
+Печатает байты ответов, запросы и буферы PostgreSQL на один цикл опроса с ETag и без; падает, если страница перестала отдавать 304
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import load_api, load_clients, make_event, decode_body, response_queries
+from seed import seed
+
+ETAG_MODE = 'etag'
+FULL_MODE = 'full'
+MIN_PAGE_NOT_MODIFIED_SHARE = 0.9
+
+def add_reactions(conn, users: int, count: int):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO reactions (message_id, message_created_at, user_id, emoji)
+            SELECT m.id, m.created_at, 1 + floor(random() * %s)::integer, '👍'
+            FROM messages m
+            WHERE m.id IN (SELECT 1 + floor(random() * (SELECT MAX(id) FROM messages))::integer FROM generate_series(1, %s))
+            ON CONFLICT (message_id, user_id, emoji) DO NOTHING
+        """, (users, count))
+    conn.commit()
+
+def buffers_used(dsn: str, database: str) -> int:
+    import database as pools
+    for pool in pools._db_pools.values():
+        pool.closeall()
+    time.sleep(0.5)
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT blks_hit + blks_read FROM pg_stat_database WHERE datname = %s", (database,))
+            return cur.fetchone()[0]
+
+def poll(api, client, chat_id: int, mode: str, stats: dict):
+    requests = {
+        'chats': make_event(client, 'GET', 'chats', etag=client.etags.get('chats') if mode == ETAG_MODE else None),
+        'messages': make_event(client, 'GET', f'messages/{chat_id}', {'limit': '50'},
+                               etag=client.etags.get(f'messages/{chat_id}') if mode == ETAG_MODE else None),
+        'sync': make_event(client, 'GET', 'sync', {'since': client.sync_cursor})
+    }
+    for name, event in requests.items():
+        response = api.handler(event, None)
+        status = response['statusCode']
+        if status >= 500:
+            stats['errors'] += 1
+        stats['bytes'] += len(response.get('body') or '')
+        stats['queries'] += response_queries(response)
+        stats[f'{name}_304'] += status == 304
+        if name == 'sync' and status == 200:
+            client.sync_cursor = decode_body(response).get('cursor', client.sync_cursor)
+        elif status == 200:
+            client.etags[event['queryStringParameters']['path']] = response['headers'].get('ETag')
+
+def run_mode(mode: str, api, clients, args, server_dsn: str, database_dsn: str, rng) -> dict:
+    stats = {'bytes': 0, 'queries': 0, 'errors': 0, 'chats_304': 0, 'messages_304': 0, 'sync_304': 0}
+    open_chats = {client.user_id: rng.choice(client.chat_ids) for client in clients}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for client in clients:
+            client.etags = {}
+            client.sync_cursor = decode_body(api.handler(make_event(client, 'GET', 'sync'), None))['cursor']
+            poll(api, client, open_chats[client.user_id], mode, dict(stats))
+        
+        buffers_before = buffers_used(server_dsn, args.database)
+        with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+            for _ in range(args.ticks):
+                add_reactions(conn, args.users, args.reactions_per_tick)
+                for client in clients:
+                    poll(api, client, open_chats[client.user_id], mode, stats)
+        buffers = buffers_used(server_dsn, args.database) - buffers_before
+    
+    polls = args.ticks * len(clients)
+    return {
+        'mode': mode,
+        'bytes': stats['bytes'] / polls,
+        'queries': stats['queries'] / polls,
+        'buffers': buffers / polls,
+        'chats_304': stats['chats_304'] / polls,
+        'messages_304': stats['messages_304'] / polls,
+        'errors': stats['errors']
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Measure what an idle open chat costs per polling cycle')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_idle_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--users', type=int, default=2000, help='Seeded users')
+    parser.add_argument('--clients', type=int, default=50, help='Idle clients, each with one open chat')
+    parser.add_argument('--ticks', type=int, default=20, help='Polling cycles per mode')
+    parser.add_argument('--reactions-per-tick', type=int, default=20, help='Reactions other users add across all chats between cycles')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for client and chat selection')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': args.users, 'chats': 300, 'members_per_chat': 8, 'messages': 100000, 'months': 2}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    
+    rng = random.Random(args.seed)
+    clients = load_clients(api, tokens, args.clients, rng)
+    print(f'{args.clients} idle clients, {args.ticks} cycles of chats + messages + sync, '
+          f'{args.reactions_per_tick} new reactions per cycle; averages per client per cycle')
+    print(f"{'mode':<6}{'bytes':>9}{'queries':>9}{'buffers':>9}{'chats 304':>11}{'page 304':>10}")
+    failed = False
+    for mode in (FULL_MODE, ETAG_MODE):
+        row = run_mode(mode, api, clients, args, server_dsn, database_dsn, rng)
+        print(f"{row['mode']:<6}{row['bytes']:>9.0f}{row['queries']:>9.1f}{row['buffers']:>9.0f}"
+              f"{row['chats_304']:>10.0%}{row['messages_304']:>10.0%}")
+        if row['errors']:
+            print(f"FAIL {mode}: {row['errors']} server errors")
+            failed = True
+        if mode == ETAG_MODE and row['messages_304'] < MIN_PAGE_NOT_MODIFIED_SHARE:
+            print(f"FAIL {mode}: only {row['messages_304']:.0%} of unchanged message pages answered 304")
+            failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Микробенчмарк проверки JWT: холодная проверка с HMAC, попадание в кэш подписей и вытеснение при вдвое большем числе токенов
+Прогоняется в одном потоке и в нескольких, база данных не нужна; падает, если валидный токен не прошёл проверку или кэш вырос больше JWT_CACHE_SIZE
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from load_test import API_DIR
+
+MODES = ('cold', 'warm', 'churn')
+
+def load_tokens():
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret')
+    sys.path.insert(0, API_DIR)
+    import tokens
+    return tokens
+
+def verify_all(tokens, jwts, mode: str, failures: list):
+    for jwt in jwts:
+        if mode == 'cold':
+            with tokens._verified_tokens_lock:
+                tokens._verified_tokens.clear()
+        if tokens.verify_jwt(jwt) is None:
+            failures.append(jwt)
+
+def run_mode(tokens, jwts, mode: str, threads: int) -> dict:
+    tokens._verified_tokens.clear()
+    if mode == 'warm':
+        for jwt in jwts[:tokens.JWT_CACHE_SIZE]:
+            tokens.verify_jwt(jwt)
+    
+    failures = []
+    chunks = [jwts[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=verify_all, args=(tokens, chunk, mode, failures)) for chunk in chunks]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'per_second': len(jwts) / elapsed,
+        'us_per_call': elapsed / len(jwts) * 1e6 * threads,
+        'failures': len(failures),
+        'cache_size': len(tokens._verified_tokens)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark JWT verification with and without the signature cache')
+    parser.add_argument('--tokens', type=int, default=500, help='Distinct tokens, kept below JWT_CACHE_SIZE for the warm run')
+    parser.add_argument('--rounds', type=int, default=40, help='Times every token is verified per row')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8], help='Concurrent verifier thread counts')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    tokens = load_tokens()
+    distinct = [tokens.create_jwt(user_id, f'user{user_id}') for user_id in range(1, args.tokens + 1)]
+    jwts = distinct * args.rounds
+    churn = [tokens.create_jwt(user_id, f'user{user_id}') for user_id in range(1, 2 * tokens.JWT_CACHE_SIZE + 1)]
+    workloads = {'cold': jwts, 'warm': jwts, 'churn': (churn * (len(jwts) // len(churn) + 1))[:len(jwts)]}
+    
+    print(f'{len(jwts)} verifications of {args.tokens} tokens per row, cache size {tokens.JWT_CACHE_SIZE}')
+    print(f"{'mode':<6}{'threads':>8}{'per second':>13}{'us/call':>10}")
+    failed = False
+    for threads in args.threads:
+        for mode in MODES:
+            row = run_mode(tokens, workloads[mode], mode, threads)
+            print(f"{mode:<6}{threads:>8}{row['per_second']:>13.0f}{row['us_per_call']:>10.2f}")
+            if row['failures']:
+                print(f"FAIL {mode} x{threads}: {row['failures']} valid tokens rejected")
+                failed = True
+            if row['cache_size'] > tokens.JWT_CACHE_SIZE:
+                print(f"FAIL {mode} x{threads}: cache grew to {row['cache_size']} entries")
+                failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Бенчмарк доставки сообщений: long-poll через LISTEN/NOTIFY против опроса sync с фиксированным интервалом
+Несколько отправителей пишут в один чат одновременно; печатает задержку доставки и число запросов получателя, падает при потерянных сообщениях
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile, response_queries
+from seed import seed_users
+
+LONG_POLL_MODE = 'listen'
+POLLING_MODE = 'sync'
+
+def create_chat(api, partitions, dsn: str, members: int) -> int:
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            this_month = date.today().replace(day=1)
+            partitions.create_partitions(cur, partitions.add_months(this_month, -1), partitions.add_months(this_month, 2))
+            seed_users(cur, members)
+            cur.execute("INSERT INTO chats (type, name, created_by) VALUES ('group', 'Long-poll', 1) RETURNING id")
+            chat_id = cur.fetchone()['id']
+            cur.execute("""
+                INSERT INTO chat_members (chat_id, user_id, role)
+                SELECT %s, id, CASE WHEN id = 1 THEN 'owner' ELSE 'member' END FROM users
+            """, (chat_id,))
+            api.rebuild_chat_summary(cur, chat_id)
+        conn.commit()
+    return chat_id
+
+def send_messages(api, sender: Client, chat_id: int, count: int, pause, rng, sent_at: dict, failures: list):
+    for i in range(count):
+        time.sleep(rng.uniform(*pause))
+        started = time.perf_counter()
+        response = api.handler(make_event(sender, 'POST', 'send', body={'chat_id': chat_id, 'text': f'Сообщение {i}'}), None)
+        if response['statusCode'] != 200:
+            failures.append(f"send returned {response['statusCode']}")
+            continue
+        sent_at[decode_body(response)['message']['id']] = started
+
+def receive_long_poll(api, receiver: Client, chat_id: int, after_id: int, timeout: float, received_at: dict, stats: dict, done):
+    params = {'after_id': str(after_id), 'timeout': str(timeout)}
+    while not done():
+        response = api.handler(make_event(receiver, 'GET', f'listen/{chat_id}', params), None)
+        now = time.perf_counter()
+        stats['requests'] += 1
+        stats['queries'] += response_queries(response)
+        if response['statusCode'] == 200:
+            messages = decode_body(response)['messages']
+            for message in messages:
+                received_at.setdefault(message['id'], now)
+            params.update(after_id=str(messages[-1]['id']), after_created_at=messages[-1]['created_at'])
+
+def latest_message_id(api, receiver: Client, chat_id: int) -> int:
+    messages = decode_body(api.handler(make_event(receiver, 'GET', f'messages/{chat_id}', {'limit': '1'}), None))['messages']
+    return messages[-1]['id'] if messages else 0
+
+def reload_messages(api, receiver: Client, chat_id: int, after_id: int, received_at: dict, stats: dict):
+    while True:
+        response = api.handler(make_event(receiver, 'GET', f'messages/{chat_id}', {'after_id': str(after_id), 'limit': '500'}), None)
+        now = time.perf_counter()
+        stats['requests'] += 1
+        stats['queries'] += response_queries(response)
+        messages = decode_body(response).get('messages', [])
+        if not messages:
+            return
+        for message in messages:
+            received_at.setdefault(message['id'], now)
+        after_id = messages[-1]['id']
+
+def receive_polling(api, receiver: Client, chat_id: int, after_id: int, cursor: str, interval: float, received_at: dict, stats: dict, done):
+    while not done():
+        response = api.handler(make_event(receiver, 'GET', 'sync', {'since': cursor}), None)
+        now = time.perf_counter()
+        stats['requests'] += 1
+        stats['queries'] += response_queries(response)
+        if response['statusCode'] == 200:
+            body = decode_body(response)
+            cursor = body['cursor']
+            if body.get('reset'):
+                reload_messages(api, receiver, chat_id, max(received_at, default=after_id), received_at, stats)
+            for message in body.get('messages', []):
+                if message['chat_id'] == chat_id:
+                    received_at.setdefault(message['id'], now)
+        time.sleep(interval)
+
+def run_mode(mode: str, api, clients, chat_id: int, args, rng) -> dict:
+    receiver, senders = clients[0], clients[1:]
+    sent_at, received_at, failures = {}, {}, []
+    stats = {'requests': 0, 'queries': 0}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        after_id = latest_message_id(api, receiver, chat_id)
+        if mode == LONG_POLL_MODE:
+            receive, start = receive_long_poll, (after_id, args.listen_timeout)
+        else:
+            cursor = decode_body(api.handler(make_event(receiver, 'GET', 'sync'), None))['cursor']
+            receive, start = receive_polling, (after_id, cursor, args.poll_interval)
+        
+        senders_done = threading.Event()
+        deadline = []
+        
+        def done():
+            if not senders_done.is_set():
+                return False
+            if not deadline:
+                deadline.append(time.perf_counter() + 2 * max(args.poll_interval, args.listen_timeout))
+            return set(sent_at) <= set(received_at) or time.perf_counter() > deadline[0]
+        
+        receiver_thread = threading.Thread(target=receive, args=(api, receiver, chat_id, *start, received_at, stats, done))
+        receiver_thread.start()
+        sender_threads = [
+            threading.Thread(target=send_messages, args=(api, sender, chat_id, args.messages // len(senders), args.pause,
+                                                         random.Random(rng.random()), sent_at, failures))
+            for sender in senders
+        ]
+        for thread in sender_threads:
+            thread.start()
+        for thread in sender_threads:
+            thread.join()
+        senders_done.set()
+        receiver_thread.join()
+    
+    latencies = sorted((received_at[message_id] - started) * 1000 for message_id, started in sent_at.items() if message_id in received_at)
+    lost = len(set(sent_at) - set(received_at))
+    if lost:
+        failures.append(f'{lost} of {len(sent_at)} messages never delivered')
+    return {
+        'mode': mode,
+        'sent': len(sent_at),
+        'p50_ms': percentile(latencies, 0.50) if latencies else 0.0,
+        'p95_ms': percentile(latencies, 0.95) if latencies else 0.0,
+        'max_ms': latencies[-1] if latencies else 0.0,
+        'requests': stats['requests'],
+        'queries': stats['queries'],
+        'failures': failures
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compare long-poll message delivery with the sync polling loop')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_listen_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--senders', type=int, default=4, help='Users sending into the chat concurrently')
+    parser.add_argument('--messages', type=int, default=40, help='Messages per mode, split between senders')
+    parser.add_argument('--pause', type=float, nargs=2, default=[0.05, 0.8], metavar=('MIN', 'MAX'), help='Pause before each send, seconds')
+    parser.add_argument('--poll-interval', type=float, default=3.0, help='Frontend sync polling interval, seconds')
+    parser.add_argument('--listen-timeout', type=float, default=5.0, help='Long-poll timeout, seconds')
+    parser.add_argument('--modes', nargs='+', choices=[LONG_POLL_MODE, POLLING_MODE], default=[LONG_POLL_MODE, POLLING_MODE])
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for send pauses')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.senders + 2))
+    api, tokens, partitions = load_api(database_dsn)
+    chat_id = create_chat(api, partitions, database_dsn, args.senders + 1)
+    clients = [Client(user_id, tokens.create_jwt(user_id, f'user{user_id}'), [chat_id]) for user_id in range(1, args.senders + 2)]
+    rng = random.Random(args.seed)
+    
+    print(f'{args.messages} messages per mode from {args.senders} concurrent senders, '
+          f'sync every {args.poll_interval:g} s, long-poll timeout {args.listen_timeout:g} s')
+    print(f"{'mode':<8}{'sent':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'requests':>10}{'queries':>9}")
+    failed = False
+    for mode in args.modes:
+        row = run_mode(mode, api, clients, chat_id, args, rng)
+        print(f"{row['mode']:<8}{row['sent']:>6}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['max_ms']:>10.1f}"
+              f"{row['requests']:>10}{row['queries']:>9}")
+        for failure in row['failures']:
+            print(f'FAIL {mode}: {failure}')
+            failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+Нагрузочный тест API: поднимает PostgreSQL, применяет миграции, наполняет данными и вызывает handler напрямую
+Печатает p50/p95/p99 и число запросов к БД по маршрутам, сохраняет baseline и падает при регрессии относительно него
+"""
+import argparse
+import base64
+import contextlib
+import functools
+import gzip
+import json
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'backend', 'api')
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from seed import seed, DEFAULT_SIZES, FIRST_NAMES
+
+TRAFFIC_MIX = {
+    'sync': 45,
+    'chats': 8,
+    'messages': 15,
+    'messages_before': 5,
+    'send': 10,
+    'read': 10,
+    'search': 7
+}
+MESSAGES_PAGE_SIZE = 50
+DEFAULT_TOLERANCE = 0.2
+NOISE_FLOOR_MS = 2.0
+QUERIES_TOLERANCE = 0.05
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+def load_api(dsn: str, read_dsn: str = None):
+    os.environ['DATABASE_URL'] = dsn
+    if read_dsn:
+        os.environ['DATABASE_READ_URL'] = read_dsn
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret')
+    os.environ['INSTRUMENTATION_ENABLED'] = '1'
+    os.environ['SLOW_QUERY_MS'] = '1e9'
+    os.environ.setdefault('RATE_LIMIT_PER_SECOND', '1e9')
+    os.environ.setdefault('RATE_LIMIT_BURST', '1e9')
+    sys.path.insert(0, API_DIR)
+    import index
+    import tokens
+    import manage_message_partitions
+    return index, tokens, manage_message_partitions
+
+class Client:
+    def __init__(self, user_id: int, token: str, chat_ids):
+        self.user_id = user_id
+        self.token = token
+        self.chat_ids = chat_ids
+        self.sync_cursor = ''
+        self.etags = {}
+        self.oldest_messages = {}
+
+def load_clients(api, tokens, count: int, rng):
+    conn = api.get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT cm.user_id, u.username, array_agg(cm.chat_id ORDER BY cm.chat_id)
+            FROM chat_members cm
+            JOIN users u ON u.id = cm.user_id
+            GROUP BY cm.user_id, u.username
+            ORDER BY cm.user_id
+        """)
+        members = cur.fetchall()
+        conn.commit()
+        cur.close()
+    finally:
+        api.release_db_connection(conn)
+    
+    if not members:
+        raise RuntimeError('Database has no chat members: seed it first')
+    
+    chosen = rng.sample(members, min(count, len(members)))
+    return [Client(user_id, tokens.create_jwt(user_id, username), chat_ids) for user_id, username, chat_ids in chosen]
+
+def decode_body(response: dict):
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        body = gzip.decompress(base64.b64decode(body)).decode()
+    return json.loads(body) if body else {}
+
+def make_event(client: Client, method: str, path: str, params=None, body=None, etag=None):
+    headers = {'Authorization': f'Bearer {client.token}', 'Accept-Encoding': 'gzip, deflate, br'}
+    if etag:
+        headers['If-None-Match'] = etag
+    return {
+        'httpMethod': method,
+        'queryStringParameters': {'path': path, **(params or {})},
+        'headers': headers,
+        'body': json.dumps(body) if body is not None else None
+    }
+
+def build_request(action: str, client: Client, rng):
+    chat_id = rng.choice(client.chat_ids)
+    
+    if action == 'sync':
+        return make_event(client, 'GET', 'sync', {'since': client.sync_cursor})
+    if action == 'chats':
+        return make_event(client, 'GET', 'chats', etag=client.etags.get('chats'))
+    if action == 'messages':
+        path = f'messages/{chat_id}'
+        return make_event(client, 'GET', path, {'limit': str(MESSAGES_PAGE_SIZE)}, etag=client.etags.get(path))
+    if action == 'messages_before':
+        params = {'limit': str(MESSAGES_PAGE_SIZE)}
+        if chat_id in client.oldest_messages:
+            params['before_id'], params['before_created_at'] = client.oldest_messages[chat_id]
+        return make_event(client, 'GET', f'messages/{chat_id}', params)
+    if action == 'send':
+        return make_event(client, 'POST', 'send', body={'chat_id': chat_id, 'text': f'Нагрузочное сообщение {rng.random():.6f}'})
+    if action == 'read':
+        return make_event(client, 'POST', 'read', body={'chat_id': chat_id})
+    if action == 'search':
+        query = rng.choice([rng.choice(FIRST_NAMES).lower()[:rng.randint(2, 4)], f'user{rng.randint(1, 999)}'])
+        return make_event(client, 'GET', 'search-users', {'q': query})
+    raise ValueError(f'Unknown action: {action}')
+
+def remember_response(action: str, client: Client, event: dict, response: dict):
+    status = response['statusCode']
+    path = event['queryStringParameters']['path']
+    
+    if action in ('chats', 'messages') and status == 200:
+        client.etags[path] = response['headers'].get('ETag')
+    if action == 'sync' and status == 200:
+        client.sync_cursor = decode_body(response).get('cursor', client.sync_cursor)
+    if action in ('messages', 'messages_before') and status == 200:
+        messages = decode_body(response).get('messages', [])
+        if messages:
+            client.oldest_messages[int(path.split('/')[1])] = (str(messages[0]['id']), messages[0]['created_at'])
+
+def run_load(api, clients, requests: int, warmup: int, mix: dict, rng):
+    actions = list(mix)
+    weights = [mix[action] for action in actions]
+    results = {action: {'latencies': [], 'queries': [], 'statuses': {}} for action in actions}
+    
+    with open(os.devnull, 'w') as devnull:
+        for i in range(warmup + requests):
+            action = rng.choices(actions, weights)[0]
+            client = rng.choice(clients)
+            event = build_request(action, client, rng)
+            
+            with contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                response = api.handler(event, None)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            
+            remember_response(action, client, event, response)
+            if i < warmup:
+                continue
+            
+            result = results[action]
+            result['latencies'].append(elapsed_ms)
+            result['queries'].append(response_queries(response))
+            status = str(response['statusCode'])
+            result['statuses'][status] = result['statuses'].get(status, 0) + 1
+    
+    return results
+
+def percentile(sorted_values, fraction: float) -> float:
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def response_queries(response: dict) -> int:
+    match = SERVER_TIMING_QUERIES.search(response.get('headers', {}).get('Server-Timing', ''))
+    return int(match.group(1)) if match else 0
+
+def timed(func, repeats: int):
+    latencies = []
+    result = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            started = time.perf_counter()
+            result = func()
+            latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies), result
+
+def summarize(results: dict) -> dict:
+    summary = {}
+    for action, result in results.items():
+        latencies = sorted(result['latencies'])
+        if not latencies:
+            continue
+        summary[action] = {
+            'count': len(latencies),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries_per_request': round(statistics.mean(result['queries']), 3),
+            'statuses': result['statuses']
+        }
+    return summary
+
+def print_summary(summary: dict):
+    print(f"{'route':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}  statuses")
+    for action, row in summary.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(row['statuses'].items()))
+        print(f"{action:<16}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+              f"{row['queries_per_request']:>9.2f}  {statuses}")
+
+def find_failures(summary: dict):
+    failures = []
+    for action, row in summary.items():
+        errors = sum(count for status, count in row['statuses'].items() if status.startswith('5'))
+        if errors:
+            failures.append(f'{action}: {errors} server errors')
+    return failures
+
+def compare_with_baseline(summary: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for action, base in baseline['routes'].items():
+        row = summary.get(action)
+        if not row:
+            continue
+        p95_limit = base['p95_ms'] * (1 + tolerance)
+        if row['p95_ms'] > p95_limit and row['p95_ms'] - base['p95_ms'] > NOISE_FLOOR_MS:
+            regressions.append(f"{action}: p95 {row['p95_ms']:.2f} ms > baseline {base['p95_ms']:.2f} ms (+{tolerance:.0%})")
+        if row['queries_per_request'] > base['queries_per_request'] + QUERIES_TOLERANCE:
+            regressions.append(f"{action}: {row['queries_per_request']:.2f} queries/request > baseline {base['queries_per_request']:.2f}")
+    return regressions
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        action, _, weight = item.partition('=')
+        if action.strip() not in TRAFFIC_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown action: {action}')
+        mix[action.strip()] = float(weight)
+    return mix
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API handler against a seeded PostgreSQL')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_bench', help='Benchmark database name, recreated unless --skip-seed')
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse an already seeded database (requires --dsn)')
+    parser.add_argument('--read-dsn', help='Read replica of --dsn (maintenance database) for read-only routes')
+    parser.add_argument('--replica', action='store_true', help='Start a streaming replica of the temporary cluster for read-only routes')
+    parser.add_argument('--users', type=int, default=DEFAULT_SIZES['users'])
+    parser.add_argument('--chats', type=int, default=DEFAULT_SIZES['chats'])
+    parser.add_argument('--members-per-chat', type=int, default=DEFAULT_SIZES['members_per_chat'])
+    parser.add_argument('--messages', type=int, default=DEFAULT_SIZES['messages'])
+    parser.add_argument('--months', type=int, default=DEFAULT_SIZES['months'], help='Months of history to spread messages over')
+    parser.add_argument('--reaction-rate', type=float, default=DEFAULT_SIZES['reaction_rate'])
+    parser.add_argument('--read-rate', type=float, default=DEFAULT_SIZES['read_rate'])
+    parser.add_argument('--clients', type=int, default=200, help='Number of simulated users')
+    parser.add_argument('--requests', type=int, default=5000, help='Measured requests')
+    parser.add_argument('--warmup', type=int, default=500, help='Requests sent before measuring')
+    parser.add_argument('--mix', type=parse_mix, default=TRAFFIC_MIX, help='Traffic mix, e.g. sync=45,send=10')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the traffic generator')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Write results to a baseline file')
+    parser.add_argument('--baseline', metavar='PATH', help='Fail if results regress against this baseline file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed relative p95 growth')
+    args = parser.parse_args(argv)
+    if args.skip_seed and not args.dsn:
+        parser.error('--skip-seed requires --dsn')
+    if args.read_dsn and not args.dsn:
+        parser.error('--read-dsn requires --dsn')
+    if args.replica and args.dsn:
+        parser.error('--replica starts a temporary cluster, use --read-dsn with --dsn')
+    return args
+
+def benchmark(args, server_dsn: str, start_replica=None) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    sizes = {
+        'users': args.users,
+        'chats': args.chats,
+        'members_per_chat': args.members_per_chat,
+        'messages': args.messages,
+        'months': args.months,
+        'reaction_rate': args.reaction_rate,
+        'read_rate': args.read_rate
+    }
+    
+    if not args.skip_seed:
+        recreate_database(server_dsn, args.database)
+        print('Applying migrations...')
+        apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn, args.read_dsn and f'{args.read_dsn} dbname={args.database}')
+    
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+             api.rebuild_chat_summary, api.reconcile_unread_counts)
+        print(f'Seeded in {time.perf_counter() - started:.1f} s')
+    
+    if start_replica:
+        print('Starting read replica...')
+        os.environ['DATABASE_READ_URL'] = start_replica().dsn(args.database)
+    
+    rng = random.Random(args.seed)
+    clients = load_clients(api, tokens, args.clients, rng)
+    print(f'Running {args.requests} requests ({args.warmup} warmup) from {len(clients)} clients...')
+    summary = summarize(run_load(api, clients, args.requests, args.warmup, args.mix, rng))
+    print_summary(summary)
+    
+    report = {
+        'config': {**sizes, 'clients': args.clients, 'requests': args.requests, 'mix': args.mix, 'seed': args.seed},
+        'routes': summary
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(report, baseline_file, indent=2, ensure_ascii=False)
+        print(f'Baseline saved to {args.save_baseline}')
+    
+    failures = find_failures(summary)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['config'] != report['config']:
+            print('Warning: baseline was recorded with a different configuration')
+        failures += compare_with_baseline(summary, baseline, args.tolerance)
+    
+    for failure in failures:
+        print(f'FAIL {failure}')
+    return 1 if failures else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server, contextlib.ExitStack() as replicas:
+        start_replica = functools.partial(replicas.enter_context, LocalPostgres(primary=server)) if args.replica else None
+        return benchmark(args, server.dsn(), start_replica)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Временный локальный кластер PostgreSQL для нагрузочных тестов
+Создаёт кластер через initdb (или реплику через pg_basebackup), применяет миграции из db_migrations/ и удаляет всё после остановки
+"""
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import psycopg2
+
+MIGRATIONS_DIR = os.environ.get('MIGRATIONS_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db_migrations')
+
+def find_pg_bin() -> str:
+    if os.environ.get('PG_BIN'):
+        return os.environ['PG_BIN']
+    initdb = shutil.which('initdb')
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which('pg_config')
+    if pg_config:
+        return subprocess.check_output([pg_config, '--bindir'], text=True).strip()
+    raise RuntimeError('PostgreSQL binaries not found: set PG_BIN or put initdb on PATH')
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+class LocalPostgres:
+    def __init__(self, settings: dict = None, primary: 'LocalPostgres' = None):
+        self.bin_dir = find_pg_bin()
+        self.data_dir = None
+        self.port = None
+        self.settings = settings or {}
+        self.primary = primary
+    
+    def dsn(self, dbname: str = 'postgres') -> str:
+        return f'host=localhost port={self.port} user=postgres dbname={dbname}'
+    
+    def start(self):
+        self.data_dir = tempfile.mkdtemp(prefix='telegram-bench-pg-')
+        self.port = free_port()
+        try:
+            if self.primary:
+                subprocess.run(
+                    [os.path.join(self.bin_dir, 'pg_basebackup'), '-d', self.primary.dsn(), '-D', self.data_dir, '-R', '-X', 'stream', '-c', 'fast'],
+                    check=True, stdout=subprocess.DEVNULL
+                )
+            else:
+                subprocess.run(
+                    [os.path.join(self.bin_dir, 'initdb'), '-D', self.data_dir, '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                    check=True, stdout=subprocess.DEVNULL
+                )
+            options = f"-p {self.port} -k {self.data_dir} -c listen_addresses=localhost"
+            for name, value in self.settings.items():
+                options += f" -c {name}={value}"
+            subprocess.run(
+                [os.path.join(self.bin_dir, 'pg_ctl'), '-D', self.data_dir, '-o', options,
+                 '-l', os.path.join(self.data_dir, 'server.log'), '-w', 'start'],
+                check=True, stdout=subprocess.DEVNULL
+            )
+        except Exception:
+            self.stop()
+            raise
+        return self
+    
+    def stop(self):
+        if self.data_dir:
+            try:
+                subprocess.run(
+                    [os.path.join(self.bin_dir, 'pg_ctl'), '-D', self.data_dir, '-m', 'fast', '-w', 'stop'],
+                    check=False, stdout=subprocess.DEVNULL
+                )
+            finally:
+                shutil.rmtree(self.data_dir, ignore_errors=True)
+                self.data_dir = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def recreate_database(admin_dsn: str, dbname: str):
+    conn = psycopg2.connect(admin_dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+            cur.execute(f'CREATE DATABASE "{dbname}"')
+    finally:
+        conn.close()
+
+def migration_files(migrations_dir: str = MIGRATIONS_DIR):
+    files = []
+    for name in os.listdir(migrations_dir):
+        match = re.match(r'V(\d+)__.+\.sql$', name)
+        if match:
+            files.append((int(match.group(1)), os.path.join(migrations_dir, name)))
+    return [path for _, path in sorted(files)]
+
+def apply_migrations(dsn: str, migrations_dir: str = MIGRATIONS_DIR):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            for path in migration_files(migrations_dir):
+                with open(path, encoding='utf-8') as migration:
+                    cur.execute(migration.read())
+                conn.commit()
+    finally:
+        conn.close()
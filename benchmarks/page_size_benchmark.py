@@ -0,0 +1,98 @@
+"""
+Бенчмарк страниц сообщений на 50 и 500 сообщений: байты ответа и процессорное время handler с gzip и без
+Для сравнения сериализует ту же страницу прежним json.dumps(default=str) с экранированием кириллицы
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile
+from seed import seed
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+
+def busiest_chat(dsn: str):
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT m.chat_id, MIN(cm.user_id), COUNT(DISTINCT m.id)
+                FROM messages m
+                JOIN chat_members cm ON cm.chat_id = m.chat_id
+                GROUP BY m.chat_id
+                ORDER BY COUNT(DISTINCT m.id) DESC
+                LIMIT 1
+            """)
+            return cur.fetchone()
+
+def measure(call, repeats: int):
+    wall, cpu = [], []
+    result = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            started, started_cpu = time.perf_counter(), time.process_time()
+            result = call()
+            wall.append((time.perf_counter() - started) * 1000)
+            cpu.append((time.process_time() - started_cpu) * 1000)
+    return sorted(wall), sorted(cpu), result
+
+def legacy_body(messages) -> str:
+    return json.dumps({'messages': [dict(message) for message in messages]}, default=str)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark response size and CPU time of large message pages')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_page_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[50, 500], help='Messages per page')
+    parser.add_argument('--repeats', type=int, default=50, help='Measured requests per row')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': 500, 'chats': 20, 'members_per_chat': 8, 'messages': 40000, 'months': 1}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    chat_id, user_id, messages = busiest_chat(database_dsn)
+    client = Client(user_id, tokens.create_jwt(user_id, f'user{user_id}'), [chat_id])
+    
+    import responses
+    serializers = {'json': lambda page: responses.to_json({'messages': page}), 'legacy': legacy_body}
+    
+    print(f'chat {chat_id} with {messages} messages, {args.repeats} requests per row; json/legacy rows time serialization only')
+    print(f"{'page':>5}  {'row':<10}{'bytes':>9}{'p50 ms':>9}{'cpu p50 ms':>12}")
+    failed = False
+    for page_size in args.page_sizes:
+        page = []
+        for encoding in (IDENTITY, GZIP):
+            event = make_event(client, 'GET', f'messages/{chat_id}', {'limit': str(page_size)})
+            event['headers']['Accept-Encoding'] = encoding
+            wall, cpu, response = measure(lambda: api.handler(event, None), args.repeats)
+            print(f"{page_size:>5}  {encoding:<10}{len(response['body']):>9}{percentile(wall, 0.50):>9.2f}{percentile(cpu, 0.50):>12.2f}")
+            page = decode_body(response).get('messages', []) if response['statusCode'] == 200 else []
+            if len(page) != min(page_size, messages):
+                print(f"FAIL {page_size} ({encoding}): handler returned {response['statusCode']} with {len(page)} messages")
+                failed = True
+        for name, serialize in serializers.items():
+            wall, cpu, body = measure(lambda: serialize(page), args.repeats)
+            print(f"{page_size:>5}  {name:<10}{len(body):>9}{percentile(wall, 0.50):>9.2f}{percentile(cpu, 0.50):>12.2f}")
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Бенчмарк пула соединений: задержка запроса с пулом и с новым соединением на каждый запрос, как было до пула
+Для честного сравнения handshake лучше запускать с --dsn реального сервера с паролем или TLS
+"""
+import argparse
+import contextlib
+import random
+import sys
+
+import psycopg2
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import load_api, load_clients, make_event, percentile, timed
+from seed import seed
+
+POOLED_MODE = 'pool'
+CONNECT_MODE = 'connect'
+ROUTES = ('chats', 'messages', 'send')
+
+@contextlib.contextmanager
+def connection_per_request(api, dsn: str):
+    saved = api.get_db_connection, api.release_db_connection
+    api.get_db_connection = lambda role=None: psycopg2.connect(dsn)
+    api.release_db_connection = lambda conn: conn.close()
+    try:
+        yield
+    finally:
+        api.get_db_connection, api.release_db_connection = saved
+
+def route_event(route: str, client, rng):
+    chat_id = rng.choice(client.chat_ids)
+    if route == 'chats':
+        return make_event(client, 'GET', 'chats')
+    if route == 'messages':
+        return make_event(client, 'GET', f'messages/{chat_id}', {'limit': '50'})
+    return make_event(client, 'POST', 'send', body={'chat_id': chat_id, 'text': f'Сообщение {rng.random():.6f}'})
+
+def run_mode(mode: str, api, dsn: str, clients, route: str, requests: int, rng) -> dict:
+    statuses = {}
+    
+    def call():
+        response = api.handler(route_event(route, rng.choice(clients), rng), None)
+        statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+    
+    with connection_per_request(api, dsn) if mode == CONNECT_MODE else contextlib.nullcontext():
+        latencies, _ = timed(call, requests)
+    return {
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'errors': sum(count for status, count in statuses.items() if status >= 500)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark per-request latency with and without the connection pool')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_pool_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--requests', type=int, default=500, help='Measured requests per mode and route')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the traffic generator')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': 2000, 'chats': 300, 'members_per_chat': 8, 'messages': 100000, 'months': 2}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    
+    rng = random.Random(args.seed)
+    clients = load_clients(api, tokens, 100, rng)
+    print(f'{args.requests} requests per row')
+    print(f"{'route':<10}{'mode':<9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    failed = False
+    for route in args.routes:
+        for mode in (CONNECT_MODE, POOLED_MODE):
+            row = run_mode(mode, api, database_dsn, clients, route, args.requests, rng)
+            print(f"{route:<10}{mode:<9}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+            if row['errors']:
+                print(f"FAIL {route} ({mode}): {row['errors']} server errors")
+                failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Бенчмарк страницы сообщений при больших таблицах реакций
+Сравнивает прежнюю агрегацию реакций отдельным запросом на каждое сообщение с одним запросом на страницу
+"""
+import argparse
+import contextlib
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile, response_queries, timed
+from seed import seed, seed_reactions
+
+LEGACY_PAGE_QUERY = """
+    SELECT
+        m.id, m.text, m.message_type, m.media_url, m.media_name, m.media_size,
+        m.is_edited, m.is_forwarded, m.reply_to_id, m.created_at,
+        m.sender_id, u.first_name, u.last_name, u.username, u.avatar_url
+    FROM messages m
+    JOIN users u ON u.id = m.sender_id
+    WHERE m.chat_id = %s
+    ORDER BY m.created_at DESC
+    LIMIT %s
+"""
+LEGACY_REACTIONS_QUERY = """
+    SELECT r.emoji, COUNT(*) as count, BOOL_OR(r.user_id = %s) as selected
+    FROM reactions r
+    WHERE r.message_id = %s
+    GROUP BY r.emoji
+"""
+
+def legacy_page(cur, user_id: int, chat_id: int, limit: int):
+    cur.execute(LEGACY_PAGE_QUERY, (chat_id, limit))
+    messages = [dict(message) for message in reversed(cur.fetchall())]
+    for message in messages:
+        cur.execute(LEGACY_REACTIONS_QUERY, (user_id, message['id']))
+        message['reactions'] = [dict(reaction) for reaction in cur.fetchall()]
+    return messages
+
+def reseed_reactions(dsn: str, users: int, reaction_rate: float) -> int:
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE reactions")
+            seed_reactions(cur, users, reaction_rate)
+            conn.commit()
+            conn.autocommit = True
+            cur.execute("VACUUM ANALYZE reactions")
+            cur.execute("SELECT COUNT(*) FROM reactions")
+            return cur.fetchone()[0]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark a messages page against large reaction tables')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_reactions_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--users', type=int, default=5000, help='Seeded users')
+    parser.add_argument('--messages', type=int, default=500000, help='Seeded messages')
+    parser.add_argument('--reaction-rates', type=float, nargs='+', default=[0.1, 0.5, 1.0],
+                        help='Share of messages with reactions; the reactions table is reseeded for each')
+    parser.add_argument('--page-size', type=int, default=50, help='Messages per page')
+    parser.add_argument('--repeats', type=int, default=30, help='Measured requests per reaction rate')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': args.users, 'chats': 200, 'members_per_chat': 8, 'messages': args.messages,
+             'months': 2, 'reaction_rate': 0, 'read_rate': 0.8}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT cm.chat_id, cm.user_id, u.username
+                FROM chat_members cm
+                JOIN users u ON u.id = cm.user_id
+                WHERE cm.chat_id = (SELECT chat_id FROM messages GROUP BY chat_id ORDER BY COUNT(*) DESC LIMIT 1)
+                LIMIT 1
+            """)
+            chat_id, user_id, username = cur.fetchone()
+    client = Client(user_id, tokens.create_jwt(user_id, username), [chat_id])
+    path = f'messages/{chat_id}'
+    params = {'limit': str(args.page_size)}
+    
+    print(f'{args.repeats} requests per row, {args.page_size}-message page of the busiest chat, {args.messages} messages')
+    print(f"{'rate':>6}{'reactions':>11}{'legacy p50':>12}{'p95':>9}{'queries':>9}{'current p50':>13}{'p95':>9}{'queries':>9}")
+    failed = False
+    with contextlib.closing(psycopg2.connect(database_dsn)) as legacy_conn:
+        legacy_cur = legacy_conn.cursor(cursor_factory=RealDictCursor)
+        for reaction_rate in args.reaction_rates:
+            reactions = reseed_reactions(database_dsn, args.users, reaction_rate)
+            
+            legacy_latencies, legacy_messages = timed(lambda: legacy_page(legacy_cur, user_id, chat_id, args.page_size), args.repeats)
+            legacy_conn.rollback()
+            latencies, response = timed(lambda: api.handler(make_event(client, 'GET', path, params), None), args.repeats)
+            
+            print(f"{reaction_rate:>6.2f}{reactions:>11}{percentile(legacy_latencies, 0.5):>12.2f}"
+                  f"{percentile(legacy_latencies, 0.95):>9.2f}{len(legacy_messages) + 1:>9}"
+                  f"{percentile(latencies, 0.5):>13.2f}{percentile(latencies, 0.95):>9.2f}{response_queries(response):>9}")
+            
+            messages = decode_body(response).get('messages', []) if response['statusCode'] == 200 else []
+            expected = {message['id']: sum(r['count'] for r in message['reactions']) for message in legacy_messages}
+            actual = {message['id']: sum(r['count'] for r in message['reactions']) for message in messages}
+            if actual != expected:
+                print(f"FAIL rate {reaction_rate}: handler returned different reactions than the per-message query "
+                      f"(status {response['statusCode']})")
+                failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
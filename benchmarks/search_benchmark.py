@@ -0,0 +1,83 @@
+"""
+Бенчмарк поиска пользователей: задержка search-users на растущем корпусе против исходного запроса с тремя LIKE '%q%'
+Двухсимвольные запросы идут по префиксным индексам, длинные — по триграммному; без pg_trgm второй путь не показателен
+"""
+import argparse
+import contextlib
+import sys
+
+import psycopg2
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body, percentile, timed
+from seed import seed_users
+
+LEGACY_SEARCH_QUERY = """
+    SELECT id, username, first_name, last_name, avatar_url, bio
+    FROM users
+    WHERE username LIKE %s OR LOWER(first_name) LIKE %s OR LOWER(last_name) LIKE %s
+    LIMIT 20
+"""
+
+QUERIES = ('us', 'ан', 'sm', 'user12', 'мари', 'smith', 'zzz')
+
+def grow_corpus(dsn: str, current: int, target: int):
+    with contextlib.closing(psycopg2.connect(dsn)) as conn:
+        with conn.cursor() as cur:
+            seed_users(cur, target - current, first=current + 1)
+            cur.execute("ANALYZE users")
+        conn.commit()
+
+def legacy_search(conn, query: str):
+    pattern = f'%{query}%'
+    with conn.cursor() as cur:
+        cur.execute(LEGACY_SEARCH_QUERY, (pattern, pattern, pattern))
+        return cur.fetchall()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark user search latency against the users table size')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_search_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000], help='Users table sizes to measure')
+    parser.add_argument('--queries', nargs='+', default=list(QUERIES), help='Search strings (2 characters take the prefix path)')
+    parser.add_argument('--repeats', type=int, default=30, help='Measured requests per query and size')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    api, tokens, _ = load_api(database_dsn)
+    client = Client(1, tokens.create_jwt(1, 'user1'), [])
+    
+    print(f'{args.repeats} requests per row, p50/p95 in ms')
+    print(f"{'users':>8}  {'query':<8}{'rows':>6}{'current p50':>13}{'p95':>8}{'legacy p50':>12}{'p95':>8}")
+    failed = False
+    current = 0
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        conn.autocommit = True
+        for size in sorted(args.sizes):
+            grow_corpus(database_dsn, current, size)
+            current = size
+            for query in args.queries:
+                event = make_event(client, 'GET', 'search-users', {'q': query})
+                latencies, response = timed(lambda: api.handler(event, None), args.repeats)
+                legacy, _ = timed(lambda: legacy_search(conn, query), args.repeats)
+                rows = len(decode_body(response)['users']) if response['statusCode'] == 200 else 0
+                print(f"{size:>8}  {query:<8}{rows:>6}{percentile(latencies, 0.50):>13.2f}{percentile(latencies, 0.95):>8.2f}"
+                      f"{percentile(legacy, 0.50):>12.2f}{percentile(legacy, 0.95):>8.2f}")
+                if response['statusCode'] != 200:
+                    print(f"FAIL {query!r} at {size} users: search-users returned {response['statusCode']}")
+                    failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Генерация синтетических данных для нагрузочных тестов
+Сообщения распределены по чатам неравномерно: небольшая доля «горячих» чатов получает большую часть трафика
+"""
+from datetime import date
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+FIRST_NAMES = ['Алексей', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Павел', 'Наталья', 'Alex', 'Kate']
+LAST_NAMES = ['Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева', 'Новиков', 'Морозова', 'Smith', 'Brown']
+EMOJIS = ['👍', '❤️', '😂', '🔥', '😮', '🎉']
+
+DEFAULT_SIZES = {
+    'users': 10000,
+    'chats': 2000,
+    'members_per_chat': 8,
+    'messages': 1000000,
+    'months': 6,
+    'reaction_rate': 0.1,
+    'read_rate': 0.8,
+    'seed': 0.42
+}
+
+def seed_users(cur, users: int, first: int = 1):
+    cur.execute("""
+        INSERT INTO users (username, first_name, last_name, password_hash, last_seen)
+        SELECT
+            'user' || i,
+            (%s::text[])[1 + i %% array_length(%s::text[], 1)],
+            (%s::text[])[1 + (i / 7) %% array_length(%s::text[], 1)],
+            'benchmark',
+            NOW() - random() * INTERVAL '30 days'
+        FROM generate_series(%s, %s) i
+    """, (FIRST_NAMES, FIRST_NAMES, LAST_NAMES, LAST_NAMES, first, first + users - 1))
+
+def seed_chats(cur, users: int, chats: int, members_per_chat: int, months: int):
+    cur.execute("""
+        INSERT INTO chats (type, name, created_by, created_at)
+        SELECT
+            CASE WHEN i %% 3 = 0 THEN 'private' ELSE 'group' END,
+            'Чат ' || i,
+            1 + (i * 7919) %% %s,
+            LOCALTIMESTAMP - %s * INTERVAL '1 month'
+        FROM generate_series(1, %s) i
+    """, (users, months, chats))
+    
+    cur.execute("""
+        INSERT INTO chat_members (chat_id, user_id, role, joined_at)
+        SELECT c.id, 1 + (c.created_by - 1 + k * 104729) %% %s,
+               CASE WHEN k = 0 THEN 'owner' ELSE 'member' END, c.created_at
+        FROM chats c
+        CROSS JOIN LATERAL generate_series(
+            0, CASE WHEN c.type = 'private' THEN 1 ELSE GREATEST(1, (random() * 2 * %s)::integer) END
+        ) k
+        ON CONFLICT (chat_id, user_id) DO NOTHING
+    """, (users, members_per_chat))
+
+def seed_messages(cur, chats: int, messages: int, months: int):
+    cur.execute("""
+        INSERT INTO messages (chat_id, sender_id, text, created_at, updated_at)
+        SELECT chat_id, sender_id, text, created_at, created_at
+        FROM (
+            SELECT
+                1 + floor(%s * power(random(), 3))::integer as chat_id,
+                'Сообщение ' || i || ' ' || md5(i::text) as text,
+                LOCALTIMESTAMP - %s * INTERVAL '1 month' + (i::double precision / %s) * %s * INTERVAL '1 month' as created_at,
+                random() as pick
+            FROM generate_series(1, %s) i
+        ) g
+        CROSS JOIN LATERAL (
+            SELECT cm.user_id as sender_id
+            FROM chat_members cm
+            WHERE cm.chat_id = g.chat_id
+            ORDER BY cm.user_id
+            OFFSET floor(g.pick * (SELECT COUNT(*) FROM chat_members WHERE chat_id = g.chat_id))::integer
+            LIMIT 1
+        ) s
+        ORDER BY created_at
+    """, (chats, months, messages, months, messages))
+
+def seed_reactions(cur, users: int, reaction_rate: float):
+    cur.execute("""
+        INSERT INTO reactions (message_id, message_created_at, user_id, emoji)
+        SELECT m.id, m.created_at, 1 + floor(random() * %s)::integer, (%s::text[])[1 + floor(random() * array_length(%s::text[], 1))::integer]
+        FROM messages m
+        CROSS JOIN LATERAL generate_series(1, 1 + floor(power(random(), 4) * 5)::integer) r
+        WHERE random() < %s
+        ON CONFLICT (message_id, user_id, emoji) DO NOTHING
+    """, (users, EMOJIS, EMOJIS, reaction_rate))
+
+def seed_read_positions(cur, read_rate: float):
+    cur.execute("""
+        INSERT INTO read_messages (user_id, chat_id, last_read_message_id)
+        SELECT cm.user_id, cm.chat_id, lr.id
+        FROM chat_members cm
+        CROSS JOIN LATERAL (
+            SELECT m.id
+            FROM messages m
+            WHERE m.chat_id = cm.chat_id
+            ORDER BY m.id DESC
+            OFFSET floor(power(random(), 2) * 50)::integer
+            LIMIT 1
+        ) lr
+        WHERE random() < %s
+    """, (read_rate,))
+
+def finish_seed(cur, rebuild_chat_summary, reconcile_unread_counts):
+    cur.execute("""
+        UPDATE chats c SET updated_at = COALESCE(m.last_at, c.created_at)
+        FROM (SELECT chat_id, MAX(created_at) as last_at FROM messages GROUP BY chat_id) m
+        WHERE m.chat_id = c.id
+    """)
+    rebuild_chat_summary(cur)
+    reconcile_unread_counts(cur)
+
+def seed(dsn: str, sizes: dict, create_partitions, add_months, rebuild_chat_summary, reconcile_unread_counts, log=print):
+    sizes = {**DEFAULT_SIZES, **{k: v for k, v in sizes.items() if v is not None}}
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT setseed(%s)", (sizes['seed'],))
+        
+        this_month = date.today().replace(day=1)
+        steps = [
+            ('partitions', lambda: create_partitions(cur, add_months(this_month, -sizes['months']), add_months(this_month, 3))),
+            ('users', lambda: seed_users(cur, sizes['users'])),
+            ('chats', lambda: seed_chats(cur, sizes['users'], sizes['chats'], sizes['members_per_chat'], sizes['months'])),
+            ('messages', lambda: seed_messages(cur, sizes['chats'], sizes['messages'], sizes['months'])),
+            ('reactions', lambda: seed_reactions(cur, sizes['users'], sizes['reaction_rate'])),
+            ('read positions', lambda: seed_read_positions(cur, sizes['read_rate'])),
+            ('summaries', lambda: finish_seed(cur, rebuild_chat_summary, reconcile_unread_counts))
+        ]
+        for name, step in steps:
+            log(f'Seeding {name}...')
+            step()
+            conn.commit()
+        
+        conn.autocommit = True
+        cur.execute("VACUUM ANALYZE")
+        cur.close()
+    finally:
+        conn.close()
+    return sizes
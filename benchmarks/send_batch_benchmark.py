@@ -0,0 +1,96 @@
+"""
+Бенчмарк пропускной способности отправки: сообщений в секунду через send по одному и через send-batch разного размера
+Несколько клиентов пишут одновременно в свои чаты; падает при ошибках сервера или отказах в элементах пакета
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import load_api, load_clients, make_event, decode_body, percentile
+from seed import seed
+
+def send_all(api, client, batch_size: int, messages: int, rng, latencies: list, failures: list):
+    for start in range(0, messages, batch_size):
+        items = [{'chat_id': rng.choice(client.chat_ids), 'text': f'Сообщение {start + i}'} for i in range(min(batch_size, messages - start))]
+        if batch_size == 1:
+            event = make_event(client, 'POST', 'send', body=items[0])
+        else:
+            event = make_event(client, 'POST', 'send-batch', body={'messages': items})
+        started = time.perf_counter()
+        response = api.handler(event, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            failures.append(f"{response['statusCode']} from {'send' if batch_size == 1 else 'send-batch'}")
+        elif batch_size > 1:
+            failures.extend(result['error'] for result in decode_body(response)['results'] if 'error' in result)
+
+def run_row(api, clients, batch_size: int, messages: int, rng) -> dict:
+    latencies, failures = [], []
+    workers = [
+        threading.Thread(target=send_all, args=(api, client, batch_size, messages // len(clients), random.Random(rng.random()), latencies, failures))
+        for client in clients
+    ]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'per_second': messages // len(clients) * len(clients) / elapsed,
+        'requests': len(latencies),
+        'p95_ms': percentile(latencies, 0.95),
+        'failures': failures
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark message throughput of send against send-batch')
+    parser.add_argument('--dsn', help='Existing server DSN (maintenance database); a temporary cluster is started otherwise')
+    parser.add_argument('--database', default='telegram_send_bench', help='Benchmark database name, recreated on every run')
+    parser.add_argument('--messages', type=int, default=5000, help='Messages per row, split between clients')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000], help='Items per request; 1 uses send')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4], help='Concurrent sending clients')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for chat selection')
+    return parser.parse_args(argv)
+
+def benchmark(args, server_dsn: str) -> int:
+    database_dsn = f'{server_dsn} dbname={args.database}'
+    recreate_database(server_dsn, args.database)
+    apply_migrations(database_dsn)
+    
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(max(args.clients) + 2))
+    api, tokens, partitions = load_api(database_dsn)
+    sizes = {'users': 1000, 'chats': 200, 'members_per_chat': 8, 'messages': 10000, 'months': 1}
+    seed(database_dsn, sizes, partitions.create_partitions, partitions.add_months,
+         api.rebuild_chat_summary, api.reconcile_unread_counts, log=lambda message: None)
+    
+    rng = random.Random(args.seed)
+    clients = load_clients(api, tokens, max(args.clients), rng)
+    print(f'{args.messages} messages per row')
+    print(f"{'batch':>6}{'clients':>9}{'msg/s':>10}{'requests':>10}{'p95 ms':>10}")
+    failed = False
+    for count in args.clients:
+        for batch_size in args.batch_sizes:
+            row = run_row(api, clients[:count], batch_size, args.messages, rng)
+            print(f"{batch_size:>6}{count:>9}{row['per_second']:>10.0f}{row['requests']:>10}{row['p95_ms']:>10.1f}")
+            if row['failures']:
+                print(f"FAIL batch {batch_size} x{count}: {len(row['failures'])} failures, first: {row['failures'][0]}")
+                failed = True
+    return 1 if failed else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dsn:
+        return benchmark(args, args.dsn)
+    with LocalPostgres() as server:
+        return benchmark(args, server.dsn())
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2 @@
+-- Составной индекс для курсорной пагинации истории сообщений
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id_id ON messages(chat_id, id DESC);
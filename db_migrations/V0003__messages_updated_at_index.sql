@@ -0,0 +1,2 @@
+-- Индекс для выборки отредактированных сообщений при дельта-синхронизации
+CREATE INDEX IF NOT EXISTS idx_messages_updated_at ON messages(updated_at);
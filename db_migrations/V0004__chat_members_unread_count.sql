@@ -0,0 +1,14 @@
+-- Счётчик непрочитанных сообщений, поддерживаемый при записи
+ALTER TABLE chat_members ADD COLUMN IF NOT EXISTS unread_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE chat_members cm
+SET unread_count = counts.unread_count
+FROM (
+    SELECT cm2.id, COUNT(m.id) as unread_count
+    FROM chat_members cm2
+    LEFT JOIN read_messages rm ON rm.chat_id = cm2.chat_id AND rm.user_id = cm2.user_id
+    LEFT JOIN messages m ON m.chat_id = cm2.chat_id AND m.sender_id != cm2.user_id
+        AND (rm.last_read_message_id IS NULL OR m.id > rm.last_read_message_id)
+    GROUP BY cm2.id
+) counts
+WHERE cm.id = counts.id;
@@ -0,0 +1,7 @@
+-- Триграммный поиск пользователей по username и имени
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS search_name TEXT
+    GENERATED ALWAYS AS (LOWER(username || ' ' || first_name || ' ' || COALESCE(last_name, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_users_search_name_trgm ON users USING GIN (search_name gin_trgm_ops);
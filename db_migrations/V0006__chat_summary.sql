@@ -0,0 +1,34 @@
+-- Предрасчитанная сводка чатов для списка чатов
+CREATE TABLE IF NOT EXISTS chat_summary (
+    chat_id INTEGER PRIMARY KEY REFERENCES chats(id),
+    last_message_id INTEGER REFERENCES messages(id),
+    last_message_text VARCHAR(200),
+    last_message_sender_id INTEGER REFERENCES users(id),
+    last_message_first_name VARCHAR(64),
+    last_message_last_name VARCHAR(64),
+    last_message_at TIMESTAMP,
+    members_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO chat_summary (
+    chat_id, last_message_id, last_message_text, last_message_sender_id,
+    last_message_first_name, last_message_last_name, last_message_at, members_count
+)
+SELECT
+    c.id, lm.id, LEFT(lm.text, 200), lm.sender_id,
+    lm.first_name, lm.last_name, lm.created_at, COALESCE(mc.members_count, 0)
+FROM chats c
+LEFT JOIN (
+    SELECT chat_id, COUNT(*) as members_count
+    FROM chat_members
+    GROUP BY chat_id
+) mc ON mc.chat_id = c.id
+LEFT JOIN LATERAL (
+    SELECT m.id, m.text, m.created_at, m.sender_id, u.first_name, u.last_name
+    FROM messages m
+    JOIN users u ON u.id = m.sender_id
+    WHERE m.chat_id = c.id
+    ORDER BY m.id DESC
+    LIMIT 1
+) lm ON TRUE
+ON CONFLICT (chat_id) DO NOTHING;
@@ -0,0 +1,70 @@
+-- Секционирование messages по created_at: помесячные секции и секция по умолчанию
+-- Внешние ключи на сообщения становятся составными (id, created_at), т.к. ключ секционирования входит в первичный ключ
+ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+ALTER TABLE messages RENAME TO messages_legacy;
+ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey;
+DROP INDEX IF EXISTS idx_messages_chat_id_id;
+DROP INDEX IF EXISTS idx_messages_updated_at;
+
+ALTER TABLE reactions DROP CONSTRAINT IF EXISTS reactions_message_id_fkey;
+ALTER TABLE read_messages DROP CONSTRAINT IF EXISTS read_messages_last_read_message_id_fkey;
+ALTER TABLE chat_summary DROP CONSTRAINT IF EXISTS chat_summary_last_message_id_fkey;
+
+CREATE TABLE messages (
+    id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+    chat_id INTEGER NOT NULL REFERENCES chats(id),
+    sender_id INTEGER NOT NULL REFERENCES users(id),
+    text TEXT,
+    message_type VARCHAR(20) DEFAULT 'text' CHECK (message_type IN ('text', 'photo', 'video', 'file', 'voice', 'sticker')),
+    media_url TEXT,
+    media_name VARCHAR(255),
+    media_size INTEGER,
+    reply_to_id INTEGER,
+    reply_to_created_at TIMESTAMP,
+    is_edited BOOLEAN DEFAULT FALSE,
+    is_forwarded BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+DO $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', COALESCE((SELECT MIN(created_at) FROM messages_legacy), LOCALTIMESTAMP));
+BEGIN
+    WHILE month_start <= date_trunc('month', LOCALTIMESTAMP) + INTERVAL '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_' || to_char(month_start, 'YYYY_MM'), month_start, month_start + INTERVAL '1 month'
+        );
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO messages (
+    id, chat_id, sender_id, text, message_type, media_url, media_name, media_size,
+    reply_to_id, reply_to_created_at, is_edited, is_forwarded, created_at, updated_at
+)
+SELECT
+    m.id, m.chat_id, m.sender_id, m.text, m.message_type, m.media_url, m.media_name, m.media_size,
+    r.id, CASE WHEN r.id IS NOT NULL THEN COALESCE(r.created_at, r.updated_at, LOCALTIMESTAMP) END,
+    m.is_edited, m.is_forwarded,
+    COALESCE(m.created_at, m.updated_at, LOCALTIMESTAMP), m.updated_at
+FROM messages_legacy m
+LEFT JOIN messages_legacy r ON r.id = m.reply_to_id;
+
+CREATE INDEX idx_messages_chat_id_id ON messages(chat_id, id DESC);
+CREATE INDEX idx_messages_updated_at ON messages(updated_at);
+
+ALTER TABLE messages ADD FOREIGN KEY (reply_to_id, reply_to_created_at) REFERENCES messages(id, created_at);
+
+ALTER TABLE reactions ADD COLUMN message_created_at TIMESTAMP;
+UPDATE reactions r SET message_created_at = m.created_at FROM messages m WHERE m.id = r.message_id;
+ALTER TABLE reactions ALTER COLUMN message_created_at SET NOT NULL;
+ALTER TABLE reactions ADD FOREIGN KEY (message_id, message_created_at) REFERENCES messages(id, created_at);
+
+DROP TABLE messages_legacy;
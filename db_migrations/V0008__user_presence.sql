@@ -0,0 +1,8 @@
+-- Присутствие пользователей: время последнего heartbeat в нежурналируемой таблице, статус «в сети» вычисляется по TTL
+-- Таблица очищается после сбоя сервера и не читается на репликах; users.is_online больше не используется
+CREATE UNLOGGED TABLE IF NOT EXISTS user_presence (
+    user_id INTEGER PRIMARY KEY,
+    last_seen TIMESTAMP NOT NULL
+) WITH (fillfactor = 50);
+
+ALTER TABLE users DROP COLUMN IF EXISTS is_online;
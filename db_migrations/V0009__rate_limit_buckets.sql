@@ -0,0 +1,8 @@
+-- Корзины ограничения частоты опросов для режима RATE_LIMIT_STORE=database, общие для всех экземпляров функции
+-- Таблица нежурналируемая: после сбоя корзины просто начинаются заново полными
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    bucket_key VARCHAR(100) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+) WITH (fillfactor = 50);
@@ -0,0 +1,5 @@
+-- Префиксный поиск пользователей по коротким запросам, для которых триграммный индекс почти ничего не отсекает
+-- Индексы в сортировке "C" (как text_pattern_ops) обслуживают LIKE 'ab%' и отдают строки по порядку, поэтому LIMIT читает только первые записи
+CREATE INDEX IF NOT EXISTS idx_users_username_prefix ON users ((username COLLATE "C"));
+CREATE INDEX IF NOT EXISTS idx_users_first_name_prefix ON users ((LOWER(first_name) COLLATE "C"));
+CREATE INDEX IF NOT EXISTS idx_users_last_name_prefix ON users ((LOWER(last_name) COLLATE "C"));
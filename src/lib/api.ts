@@ -9,7 +9,6 @@ export interface User {
   phone?: string;
   bio?: string;
   avatar_url?: string;
-  is_online?: boolean;
 }
 
 export interface Chat {
@@ -23,6 +22,7 @@ export interface Chat {
   is_muted: boolean;
   members?: number;
   unread_count: number;
+  peer_id?: number;
   last_message?: {
     id: number;
     text: string;
@@ -55,8 +55,23 @@ export interface Message {
   }>;
 }
 
+export interface Presence {
+  user_id: number;
+  online: boolean;
+  last_seen: string;
+}
+
+export interface SyncResult {
+  chats?: Chat[];
+  messages?: Message[];
+  cursor: string;
+  reset?: boolean;
+}
+
 export class TelegramAPI {
   private token: string | null = null;
+  private etagCache = new Map<string, { etag: string; data: unknown }>();
+  private primaryUntil: string | null = null;
 
   constructor() {
     this.token = localStorage.getItem('telegram_token');
@@ -69,9 +84,44 @@ export class TelegramAPI {
 
   clearToken() {
     this.token = null;
+    this.etagCache.clear();
     localStorage.removeItem('telegram_token');
   }
 
+  private async request(url: string, init: RequestInit): Promise<Response> {
+    const response = await fetch(url, init);
+    const primaryUntil = response.headers.get('X-Primary-Until');
+    if (primaryUntil) {
+      this.primaryUntil = primaryUntil;
+    }
+    return response;
+  }
+
+  private async conditionalGet<T>(url: string, errorMessage: string): Promise<T> {
+    const cached = this.etagCache.get(url);
+    const headers = this.getHeaders() as Record<string, string>;
+    if (cached) {
+      headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await this.request(url, { headers });
+    if (response.status === 304 && cached) {
+      return cached.data as T;
+    }
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || errorMessage);
+    }
+
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      this.etagCache.set(url, { etag, data });
+    }
+
+    return data as T;
+  }
+
   private getHeaders(): HeadersInit {
     const headers: HeadersInit = {
       'Content-Type': 'application/json',
@@ -79,11 +129,14 @@ export class TelegramAPI {
     if (this.token) {
       headers['Authorization'] = `Bearer ${this.token}`;
     }
+    if (this.primaryUntil) {
+      headers['X-Primary-Until'] = this.primaryUntil;
+    }
     return headers;
   }
 
   async register(username: string, password: string, firstName: string, lastName?: string, phone?: string) {
-    const response = await fetch(AUTH_URL, {
+    const response = await this.request(AUTH_URL, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -106,7 +159,7 @@ export class TelegramAPI {
   }
 
   async login(username: string, password: string) {
-    const response = await fetch(AUTH_URL, {
+    const response = await this.request(AUTH_URL, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
@@ -128,7 +181,7 @@ export class TelegramAPI {
   async verifyToken() {
     if (!this.token) return null;
 
-    const response = await fetch(AUTH_URL, {
+    const response = await this.request(AUTH_URL, {
       method: 'POST',
       headers: this.getHeaders(),
       body: JSON.stringify({ action: 'verify' }),
@@ -144,7 +197,12 @@ export class TelegramAPI {
   }
 
   async getChats(): Promise<Chat[]> {
-    const response = await fetch(`${API_URL}?path=chats`, {
+    const data = await this.conditionalGet<{ chats: Chat[] }>(`${API_URL}?path=chats`, 'Failed to fetch chats');
+    return data.chats;
+  }
+
+  async getChatsSnapshot(): Promise<{ chats: Chat[]; cursor: string }> {
+    const response = await this.request(`${API_URL}?path=chats&cursor=1`, {
       headers: this.getHeaders(),
     });
 
@@ -153,24 +211,69 @@ export class TelegramAPI {
       throw new Error(data.error || 'Failed to fetch chats');
     }
 
-    return data.chats;
+    return data;
   }
 
   async getMessages(chatId: number, limit = 50, offset = 0): Promise<Message[]> {
-    const response = await fetch(`${API_URL}?path=messages/${chatId}&limit=${limit}&offset=${offset}`, {
+    return this.fetchMessages(chatId, `limit=${limit}&offset=${offset}`);
+  }
+
+  async getMessagesBefore(chatId: number, beforeId: number, limit = 50, beforeCreatedAt?: string): Promise<Message[]> {
+    const bound = beforeCreatedAt ? `&before_created_at=${encodeURIComponent(beforeCreatedAt)}` : '';
+    return this.fetchMessages(chatId, `limit=${limit}&before_id=${beforeId}${bound}`);
+  }
+
+  async getMessagesAfter(chatId: number, afterId: number, limit = 50, afterCreatedAt?: string): Promise<Message[]> {
+    const bound = afterCreatedAt ? `&after_created_at=${encodeURIComponent(afterCreatedAt)}` : '';
+    return this.fetchMessages(chatId, `limit=${limit}&after_id=${afterId}${bound}`);
+  }
+
+  private async fetchMessages(chatId: number, query: string): Promise<Message[]> {
+    const data = await this.conditionalGet<{ messages: Message[] }>(
+      `${API_URL}?path=messages/${chatId}&${query}`,
+      'Failed to fetch messages',
+    );
+    return data.messages;
+  }
+
+  async listenMessages(chatId: number, afterId: number, afterCreatedAt?: string): Promise<Message[]> {
+    const bound = afterCreatedAt ? `&after_created_at=${encodeURIComponent(afterCreatedAt)}` : '';
+    const response = await this.request(`${API_URL}?path=listen/${chatId}&after_id=${afterId}${bound}`, {
       headers: this.getHeaders(),
     });
 
+    if (response.status === 204) {
+      return [];
+    }
+
     const data = await response.json();
     if (!response.ok) {
-      throw new Error(data.error || 'Failed to fetch messages');
+      throw new Error(data.error || 'Failed to listen for messages');
     }
 
     return data.messages;
   }
 
+  async sync(since?: string): Promise<SyncResult | null> {
+    const query = since ? `&since=${encodeURIComponent(since)}` : '';
+    const response = await this.request(`${API_URL}?path=sync${query}`, {
+      headers: this.getHeaders(),
+    });
+
+    if (response.status === 204) {
+      return null;
+    }
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || 'Failed to sync');
+    }
+
+    return data as SyncResult;
+  }
+
   async sendMessage(chatId: number, text: string, messageType = 'text'): Promise<Message> {
-    const response = await fetch(`${API_URL}?path=send`, {
+    const response = await this.request(`${API_URL}?path=send`, {
       method: 'POST',
       headers: this.getHeaders(),
       body: JSON.stringify({
@@ -188,8 +291,27 @@ export class TelegramAPI {
     return data.message;
   }
 
+  async markRead(chatId: number, messageId?: number, messageCreatedAt?: string): Promise<number> {
+    const response = await this.request(`${API_URL}?path=read`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+      body: JSON.stringify({
+        chat_id: chatId,
+        message_id: messageId,
+        message_created_at: messageCreatedAt,
+      }),
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || 'Failed to mark chat as read');
+    }
+
+    return data.unread_count;
+  }
+
   async createChat(type: string, name?: string, username?: string, memberIds: number[] = []): Promise<Chat> {
-    const response = await fetch(`${API_URL}?path=create-chat`, {
+    const response = await this.request(`${API_URL}?path=create-chat`, {
       method: 'POST',
       headers: this.getHeaders(),
       body: JSON.stringify({
@@ -208,8 +330,50 @@ export class TelegramAPI {
     return data.chat;
   }
 
+  async addMembers(chatId: number, memberIds: number[]): Promise<number[]> {
+    const response = await this.request(`${API_URL}?path=add-members`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+      body: JSON.stringify({
+        chat_id: chatId,
+        member_ids: memberIds,
+      }),
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || 'Failed to add members');
+    }
+
+    return data.added;
+  }
+
+  async heartbeat() {
+    const response = await this.request(`${API_URL}?path=heartbeat`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to send heartbeat');
+    }
+  }
+
+  async getPresence(userIds: number[]): Promise<Presence[]> {
+    const response = await this.request(`${API_URL}?path=presence&user_ids=${userIds.join(',')}`, {
+      headers: this.getHeaders(),
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || 'Failed to fetch presence');
+    }
+
+    return data.presence;
+  }
+
   async searchUsers(query: string): Promise<User[]> {
-    const response = await fetch(`${API_URL}?path=search-users&q=${encodeURIComponent(query)}`, {
+    const response = await this.request(`${API_URL}?path=search-users&q=${encodeURIComponent(query)}`, {
       headers: this.getHeaders(),
     });
 
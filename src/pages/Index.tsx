@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import AuthForm from '@/components/AuthForm';
 import Sidebar from '@/components/Sidebar';
 import ChatView from '@/components/ChatView';
@@ -8,6 +8,44 @@ import { api, User, Chat as APIChat, Message as APIMessage } from '@/lib/api';
 import { Chat, Message } from '@/types/telegram';
 import { useToast } from '@/hooks/use-toast';
 
+const convertChat = (chat: APIChat): Chat => ({
+  id: chat.id,
+  type: chat.type,
+  name: chat.name || `Chat ${chat.id}`,
+  username: chat.username,
+  description: chat.description,
+  avatar: chat.avatar_url,
+  lastMessage: chat.last_message ? {
+    id: chat.last_message.id,
+    chatId: chat.id,
+    senderId: chat.last_message.sender_id,
+    senderName: `${chat.last_message.first_name} ${chat.last_message.last_name || ''}`.trim(),
+    text: chat.last_message.text,
+    timestamp: new Date(chat.last_message.created_at),
+  } : undefined,
+  unreadCount: chat.unread_count || 0,
+  pinned: chat.is_pinned,
+  muted: chat.is_muted,
+  members: chat.members,
+  peerId: chat.peer_id,
+  online: false,
+});
+
+const convertMessage = (msg: APIMessage): Message => ({
+  id: msg.id,
+  chatId: msg.chat_id,
+  senderId: msg.sender_id,
+  senderName: `${msg.first_name} ${msg.last_name || ''}`.trim(),
+  text: msg.text || '',
+  timestamp: new Date(msg.created_at),
+  edited: msg.is_edited,
+  forwarded: msg.is_forwarded,
+  reactions: msg.reactions,
+});
+
+const PRESENCE_INTERVAL_MS = 25000;
+const PRESENCE_MAX_USERS = 200;
+
 const Index = () => {
   const [user, setUser] = useState<User | null>(null);
   const [isLoading, setIsLoading] = useState(true);
@@ -16,6 +54,10 @@ const Index = () => {
   const [messages, setMessages] = useState<Record<number, Message[]>>({});
   const [showChatInfo, setShowChatInfo] = useState(false);
   const [showProfile, setShowProfile] = useState(false);
+  const syncCursor = useRef<string | null>(null);
+  const selectedChatRef = useRef<number | null>(null);
+  const chatsRef = useRef<Chat[]>([]);
+  const onlineUsers = useRef<Set<number>>(new Set());
   const { toast } = useToast();
 
   useEffect(() => {
@@ -24,17 +66,57 @@ const Index = () => {
 
   useEffect(() => {
     if (user) {
+      syncCursor.current = null;
       loadChats();
-      const interval = setInterval(loadChats, 5000);
-      return () => clearInterval(interval);
+      const interval = setInterval(syncUpdates, 3000);
+      sendHeartbeat();
+      const presenceInterval = setInterval(() => {
+        sendHeartbeat();
+        refreshPresence(chatsRef.current);
+      }, PRESENCE_INTERVAL_MS);
+      return () => {
+        clearInterval(interval);
+        clearInterval(presenceInterval);
+      };
     }
   }, [user]);
 
   useEffect(() => {
+    chatsRef.current = chats;
+  }, [chats]);
+
+  useEffect(() => {
+    selectedChatRef.current = selectedChatId;
     if (selectedChatId && user) {
-      loadMessages(selectedChatId);
-      const interval = setInterval(() => loadMessages(selectedChatId), 3000);
-      return () => clearInterval(interval);
+      let cancelled = false;
+
+      const listen = async (chatId: number) => {
+        const loaded = await loadMessages(chatId);
+        let afterId = loaded.length > 0 ? loaded[loaded.length - 1].id : 0;
+        let afterCreatedAt = loaded.length > 0 ? loaded[loaded.length - 1].created_at : undefined;
+        if (afterId) {
+          markChatRead(chatId, afterId, loaded[loaded.length - 1].created_at);
+        }
+
+        while (!cancelled) {
+          try {
+            const incoming = await api.listenMessages(chatId, afterId, afterCreatedAt);
+            if (cancelled || incoming.length === 0) continue;
+            afterId = incoming[incoming.length - 1].id;
+            afterCreatedAt = incoming[incoming.length - 1].created_at;
+            mergeMessages(incoming.map((msg) => ({ ...convertMessage(msg), chatId })));
+            markChatRead(chatId, afterId, incoming[incoming.length - 1].created_at);
+          } catch (error) {
+            console.error('Failed to listen for messages:', error);
+            await new Promise((resolve) => setTimeout(resolve, 3000));
+          }
+        }
+      };
+
+      listen(selectedChatId);
+      return () => {
+        cancelled = true;
+      };
     }
   }, [selectedChatId, user]);
 
@@ -51,51 +133,115 @@ const Index = () => {
 
   const loadChats = async () => {
     try {
-      const apiChats = await api.getChats();
-      const convertedChats: Chat[] = apiChats.map((chat: APIChat) => ({
-        id: chat.id,
-        type: chat.type,
-        name: chat.name || `Chat ${chat.id}`,
-        username: chat.username,
-        description: chat.description,
-        avatar: chat.avatar_url,
-        lastMessage: chat.last_message ? {
-          id: chat.last_message.id,
-          chatId: chat.id,
-          senderId: chat.last_message.sender_id,
-          senderName: `${chat.last_message.first_name} ${chat.last_message.last_name || ''}`.trim(),
-          text: chat.last_message.text,
-          timestamp: new Date(chat.last_message.created_at),
-        } : undefined,
-        unreadCount: chat.unread_count || 0,
-        pinned: chat.is_pinned,
-        muted: chat.is_muted,
-        members: chat.members,
-        online: false,
-      }));
-      setChats(convertedChats);
+      const snapshot = await api.getChatsSnapshot();
+      const loadedChats = snapshot.chats.map(convertChat).map(withPresence);
+      setChats(loadedChats);
+      refreshPresence(loadedChats);
+      syncCursor.current = snapshot.cursor;
     } catch (error) {
       console.error('Failed to load chats:', error);
     }
   };
 
-  const loadMessages = async (chatId: number) => {
+  const withPresence = (chat: Chat): Chat => ({
+    ...chat,
+    online: chat.peerId !== undefined && onlineUsers.current.has(chat.peerId),
+  });
+
+  const sendHeartbeat = async () => {
+    try {
+      await api.heartbeat();
+    } catch (error) {
+      console.error('Failed to send heartbeat:', error);
+    }
+  };
+
+  const refreshPresence = async (chatList: Chat[]) => {
+    const peerIds = [...new Set(chatList.flatMap((chat) => (chat.peerId ? [chat.peerId] : [])))];
+    if (peerIds.length === 0) return;
+
+    try {
+      const presence = await api.getPresence(peerIds.slice(0, PRESENCE_MAX_USERS));
+      onlineUsers.current = new Set(presence.filter((entry) => entry.online).map((entry) => entry.user_id));
+      setChats(prev => prev.map(withPresence));
+    } catch (error) {
+      console.error('Failed to load presence:', error);
+    }
+  };
+
+  const loadMessages = async (chatId: number): Promise<APIMessage[]> => {
     try {
       const apiMessages = await api.getMessages(chatId);
-      const convertedMessages: Message[] = apiMessages.map((msg: APIMessage) => ({
-        id: msg.id,
-        chatId: msg.chat_id,
-        senderId: msg.sender_id,
-        senderName: `${msg.first_name} ${msg.last_name || ''}`.trim(),
-        text: msg.text || '',
-        timestamp: new Date(msg.created_at),
-        edited: msg.is_edited,
-        forwarded: msg.is_forwarded,
-        reactions: msg.reactions,
-      }));
+      const convertedMessages = apiMessages.map((msg) => ({ ...convertMessage(msg), chatId }));
       setMessages(prev => ({ ...prev, [chatId]: convertedMessages }));
+      return apiMessages;
     } catch (error) {
       console.error('Failed to load messages:', error);
+      return [];
+    }
+  };
+
+  const markChatRead = async (chatId: number, messageId: number, messageCreatedAt: string) => {
+    try {
+      const unreadCount = await api.markRead(chatId, messageId, messageCreatedAt);
+      setChats(prev => prev.map((chat) => (chat.id === chatId ? { ...chat, unreadCount } : chat)));
+    } catch (error) {
+      console.error('Failed to mark chat as read:', error);
+    }
+  };
+
+  const mergeMessages = (changedMessages: Message[]) => {
+    setMessages(prev => {
+      const byChat = new Map<number, Map<number, Message>>();
+      for (const message of changedMessages) {
+        const existing = prev[message.chatId];
+        if (!existing) continue;
+        let merged = byChat.get(message.chatId);
+        if (!merged) {
+          merged = new Map(existing.map((m) => [m.id, m]));
+          byChat.set(message.chatId, merged);
+        }
+        merged.set(message.id, message);
+      }
+
+      const next = { ...prev };
+      for (const [chatId, merged] of byChat) {
+        next[chatId] = [...merged.values()].sort((a, b) => a.id - b.id);
+      }
+      return next;
+    });
+  };
+
+  const syncUpdates = async () => {
+    if (!syncCursor.current) return;
+
+    try {
+      const result = await api.sync(syncCursor.current);
+      if (!result) return;
+
+      syncCursor.current = result.cursor;
+
+      if (result.reset) {
+        setMessages({});
+        await loadChats();
+        if (selectedChatRef.current) {
+          await loadMessages(selectedChatRef.current);
+        }
+        return;
+      }
+
+      const changedChats = (result.chats || []).map(convertChat).map(withPresence);
+      if (changedChats.length > 0) {
+        const changedIds = new Set(changedChats.map((chat) => chat.id));
+        setChats(prev => [...changedChats, ...prev.filter((chat) => !changedIds.has(chat.id))]);
+      }
+
+      const changedMessages = (result.messages || []).map(convertMessage);
+      if (changedMessages.length > 0) {
+        mergeMessages(changedMessages);
+      }
+    } catch (error) {
+      console.error('Failed to sync:', error);
     }
   };
 
@@ -104,8 +250,7 @@ const Index = () => {
 
     try {
       await api.sendMessage(selectedChatId, text);
-      await loadMessages(selectedChatId);
-      await loadChats();
+      await syncUpdates();
     } catch (error) {
       toast({
         title: 'Ошибка отправки',
@@ -143,6 +288,7 @@ const Index = () => {
     setChats([]);
     setMessages({});
     setSelectedChatId(null);
+    onlineUsers.current = new Set();
   };
 
   if (isLoading) {
@@ -22,6 +22,7 @@ export interface Chat {
   muted: boolean;
   members?: number;
   description?: string;
+  peerId?: number;
   online?: boolean;
 }
 
@@ -0,0 +1,173 @@
+"""
+Общие фикстуры тестов backend/api: временный PostgreSQL из benchmarks/local_postgres.py (или TEST_DATABASE_DSN) с миграциями
+Каждый тест получает пустые таблицы и фабрику пользователей с JWT; RandomSession выполняет случайные операции с чатами
+"""
+import contextlib
+import os
+import sys
+from datetime import date
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+from load_test import Client, load_api, make_event, decode_body
+
+TEST_DATABASE = 'telegram_test'
+
+def reset_db_pools():
+    import database
+    for pool in database._db_pools.values():
+        pool.closeall()
+    database._db_pools.clear()
+    database._db_last_used.clear()
+    database._db_connection_roles.clear()
+    database._replica_down_until = 0.0
+
+@pytest.fixture(scope='session')
+def server_dsn():
+    if os.environ.get('TEST_DATABASE_DSN'):
+        yield os.environ['TEST_DATABASE_DSN']
+        return
+    
+    try:
+        server = LocalPostgres()
+    except RuntimeError as e:
+        pytest.skip(f'PostgreSQL is not available: {e}')
+    try:
+        server.start()
+        yield server.dsn()
+    finally:
+        server.stop()
+
+@pytest.fixture(scope='session')
+def database_dsn(server_dsn):
+    dsn = f'{server_dsn} dbname={TEST_DATABASE}'
+    recreate_database(server_dsn, TEST_DATABASE)
+    apply_migrations(dsn)
+    return dsn
+
+@pytest.fixture(scope='session')
+def api_modules(database_dsn):
+    api, tokens, partitions = load_api(database_dsn)
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            this_month = date.today().replace(day=1)
+            partitions.create_partitions(cur, partitions.add_months(this_month, -2), partitions.add_months(this_month, 2))
+        conn.commit()
+    return api, tokens
+
+@pytest.fixture
+def api(api_modules, database_dsn):
+    with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE users, chats RESTART IDENTITY CASCADE")
+        conn.commit()
+    return api_modules[0]
+
+@pytest.fixture
+def db(api, database_dsn):
+    conn = psycopg2.connect(database_dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            yield cur
+    finally:
+        conn.close()
+
+@pytest.fixture
+def create_users(api, api_modules, db):
+    tokens = api_modules[1]
+    
+    def create(count: int):
+        db.execute("""
+            INSERT INTO users (username, first_name, password_hash)
+            SELECT 'test' || (i + COALESCE((SELECT MAX(id) FROM users), 0)), 'Тест', 'test'
+            FROM generate_series(1, %s) i
+            RETURNING id, username
+        """, (count,))
+        return [Client(row['id'], tokens.create_jwt(row['id'], row['username']), []) for row in db.fetchall()]
+    
+    return create
+
+@pytest.fixture
+def call(api):
+    def request(client: Client, method: str, path: str, params=None, body=None):
+        response = api.handler(make_event(client, method, path, params, body), None)
+        return response['statusCode'], decode_body(response)
+    
+    return request
+
+class RandomSession:
+    def __init__(self, call, clients, rng):
+        self.call = call
+        self.clients = clients
+        self.rng = rng
+        self.chat_ids = []
+        self.max_message_id = 0
+        self.message_chats = {}
+    
+    def create_chat(self):
+        owner = self.rng.choice(self.clients)
+        members = self.rng.sample(self.clients, self.rng.randint(1, len(self.clients) // 2))
+        status, body = self.call(owner, 'POST', 'create-chat', body={
+            'type': 'group', 'name': 'Группа', 'member_ids': [member.user_id for member in members]
+        })
+        assert status == 200, body
+        self.chat_ids.append(body['chat']['id'])
+        return ('create-chat', owner.user_id, body['chat']['id'])
+    
+    def add_members(self):
+        client, chat_id = self.rng.choice(self.clients), self.rng.choice(self.chat_ids)
+        members = self.rng.sample(self.clients, self.rng.randint(1, 3))
+        status, body = self.call(client, 'POST', 'add-members', body={
+            'chat_id': chat_id, 'member_ids': [member.user_id for member in members]
+        })
+        assert status in (200, 403), body
+        return ('add-members', client.user_id, chat_id)
+    
+    def send(self):
+        client, chat_id = self.rng.choice(self.clients), self.rng.choice(self.chat_ids)
+        status, body = self.call(client, 'POST', 'send', body={'chat_id': chat_id, 'text': 'Привет'})
+        assert status in (200, 403), body
+        if status == 200:
+            self.max_message_id = max(self.max_message_id, body['message']['id'])
+            self.message_chats[body['message']['id']] = chat_id
+        return ('send', client.user_id, chat_id)
+    
+    def send_batch(self):
+        client = self.rng.choice(self.clients)
+        items = [{'chat_id': self.rng.choice(self.chat_ids), 'text': f'Пачка {i}'} for i in range(self.rng.randint(1, 6))]
+        status, body = self.call(client, 'POST', 'send-batch', body={'messages': items})
+        assert status == 200, body
+        for result in body['results']:
+            if 'message' in result:
+                self.max_message_id = max(self.max_message_id, result['message']['id'])
+                self.message_chats[result['message']['id']] = result['message']['chat_id']
+        return ('send-batch', client.user_id, sorted({item['chat_id'] for item in items}))
+    
+    def read(self):
+        client, chat_id = self.rng.choice(self.clients), self.rng.choice(self.chat_ids)
+        body = {'chat_id': chat_id}
+        other_chats = [message_id for message_id, message_chat in self.message_chats.items() if message_chat != chat_id]
+        kind = self.rng.choices(['latest', 'any', 'other chat', 'out of range', 'invalid'], [50, 25, 10, 10, 5])[0]
+        if kind == 'any' and self.max_message_id:
+            body['message_id'] = self.rng.randint(1, self.max_message_id)
+        elif kind == 'other chat' and other_chats:
+            body['message_id'] = self.rng.choice(other_chats)
+        elif kind == 'out of range':
+            body['message_id'] = self.rng.choice([self.max_message_id + 1000, 2 ** 40])
+        elif kind == 'invalid':
+            body['message_id'] = self.rng.choice(['abc', '1.5', True, -1])
+        status, response = self.call(client, 'POST', 'read', body=body)
+        assert status in ((400,) if kind == 'invalid' else (200, 403)), response
+        return ('read', client.user_id, chat_id, body.get('message_id'), response.get('unread_count'))
+    
+    def step(self):
+        if not self.chat_ids or self.rng.random() < 0.05:
+            return self.create_chat()
+        operation = self.rng.choices([self.send, self.send_batch, self.read, self.add_members], [40, 15, 35, 10])[0]
+        return operation()
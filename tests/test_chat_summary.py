@@ -0,0 +1,78 @@
+"""
+Свойство chat_summary: после случайных send, send-batch, create-chat и add-members fetch_chats отдаёт то же, что запрос
+по базовым таблицам с LATERAL из первой версии списка чатов, а rebuild_chat_summary ничего не меняет
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+from conftest import RandomSession
+
+BASE_CHATS_QUERY = """
+    SELECT
+        c.id, COALESCE(mc.members_count, 0) as members,
+        lm.id as last_message_id, lm.text as last_message_text, lm.created_at as last_message_created_at,
+        lm.sender_id as last_message_sender_id, lm.first_name as last_message_first_name, lm.last_name as last_message_last_name
+    FROM chat_members cm
+    JOIN chats c ON c.id = cm.chat_id
+    LEFT JOIN (
+        SELECT chat_id, COUNT(*) as members_count
+        FROM chat_members
+        WHERE chat_id IN (SELECT chat_id FROM chat_members WHERE user_id = %s)
+        GROUP BY chat_id
+    ) mc ON mc.chat_id = c.id
+    LEFT JOIN LATERAL (
+        SELECT m.id, m.text, m.created_at, m.sender_id, u.first_name, u.last_name
+        FROM messages m
+        JOIN users u ON u.id = m.sender_id
+        WHERE m.chat_id = c.id
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT 1
+    ) lm ON TRUE
+    WHERE cm.user_id = %s
+    ORDER BY c.id
+"""
+
+def summarized_chats(api, db, user_id: int) -> dict:
+    chats = {}
+    for chat in api.fetch_chats(db, user_id):
+        last_message = chat['last_message']
+        if last_message is not None:
+            last_message = dict(last_message, created_at=datetime.fromisoformat(last_message['created_at']))
+        chats[chat['id']] = {'members': chat['members'], 'last_message': last_message}
+    return chats
+
+def base_chats(db, user_id: int) -> dict:
+    db.execute(BASE_CHATS_QUERY, (user_id, user_id))
+    chats = {}
+    for row in db.fetchall():
+        last_message = None
+        if row['last_message_id'] is not None:
+            last_message = {
+                'id': row['last_message_id'],
+                'text': row['last_message_text'],
+                'created_at': row['last_message_created_at'],
+                'sender_id': row['last_message_sender_id'],
+                'first_name': row['last_message_first_name'],
+                'last_name': row['last_message_last_name']
+            }
+        chats[row['id']] = {'members': row['members'], 'last_message': last_message}
+    return chats
+
+@pytest.mark.parametrize('seed', range(5))
+def test_summary_matches_base_tables(api, call, create_users, db, seed):
+    clients = create_users(8)
+    session = RandomSession(call, clients, random.Random(seed))
+    
+    history = []
+    for _ in range(120):
+        history.append(session.step())
+        if history[-1][0] == 'read':
+            continue
+        for client in clients:
+            assert summarized_chats(api, db, client.user_id) == base_chats(db, client.user_id), f'after {history[-1]}'
+    
+    maintained = {client.user_id: summarized_chats(api, db, client.user_id) for client in clients}
+    api.rebuild_chat_summary(db)
+    assert maintained == {client.user_id: summarized_chats(api, db, client.user_id) for client in clients}
@@ -0,0 +1,151 @@
+"""
+Маршрутизация запросов между основной базой и репликой: чтение идёт в реплику, запись и sync в основную базу,
+после записи X-Primary-Until держит чтение на основной базе, а при недоступной реплике запросы уходят в основную
+"""
+import contextlib
+import subprocess
+import time
+from datetime import date
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from conftest import reset_db_pools
+from load_test import Client, make_event, decode_body
+from local_postgres import LocalPostgres, recreate_database, apply_migrations
+
+ROUTING_DATABASE = 'telegram_routing'
+REPLAY_TIMEOUT_SECONDS = 10
+
+@pytest.fixture(scope='module')
+def servers(api_modules):
+    import manage_message_partitions as partitions
+    with contextlib.ExitStack() as stack:
+        try:
+            primary = stack.enter_context(LocalPostgres())
+            database_dsn = primary.dsn(ROUTING_DATABASE)
+            recreate_database(primary.dsn(), ROUTING_DATABASE)
+            apply_migrations(database_dsn)
+            with contextlib.closing(psycopg2.connect(database_dsn)) as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    this_month = date.today().replace(day=1)
+                    partitions.create_partitions(cur, partitions.add_months(this_month, -1), partitions.add_months(this_month, 2))
+                    cur.execute("""
+                        INSERT INTO users (username, first_name, password_hash)
+                        VALUES ('alice', 'Алиса', 'test'), ('bob', 'Боб', 'test')
+                    """)
+                conn.commit()
+            replica = stack.enter_context(LocalPostgres(primary=primary))
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            pytest.skip(f'A primary with a streaming standby could not be started: {e}')
+        yield primary, replica
+
+@pytest.fixture
+def routed(api_modules, servers, monkeypatch):
+    api, tokens = api_modules
+    primary, replica = servers
+    import database
+    
+    ports = []
+    checkout = api.get_db_connection
+    
+    def recording_checkout(role=database.PRIMARY):
+        conn = checkout(role)
+        ports.append(conn.info.port)
+        return conn
+    
+    reset_db_pools()
+    monkeypatch.setenv('DATABASE_URL', primary.dsn(ROUTING_DATABASE))
+    monkeypatch.setenv('DATABASE_READ_URL', replica.dsn(ROUTING_DATABASE))
+    monkeypatch.setattr(api, 'get_db_connection', recording_checkout)
+    try:
+        yield api, Client(1, tokens.create_jwt(1, 'alice'), []), ports
+    finally:
+        reset_db_pools()
+
+def wait_for_replay(primary, replica):
+    with contextlib.closing(psycopg2.connect(primary.dsn())) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn()")
+            target = cur.fetchone()[0]
+    deadline = time.monotonic() + REPLAY_TIMEOUT_SECONDS
+    with contextlib.closing(psycopg2.connect(replica.dsn())) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn", (target,))
+                if cur.fetchone()[0]:
+                    return
+                assert time.monotonic() < deadline, 'standby did not replay the primary WAL in time'
+                time.sleep(0.05)
+
+def request(api, client, ports, method, path, params=None, body=None, primary_until=None):
+    event = make_event(client, method, path, params, body)
+    if primary_until:
+        event['headers']['X-Primary-Until'] = primary_until
+    response = api.handler(event, None)
+    return response, ports[-1]
+
+def test_reads_go_to_replica_and_writes_to_primary(routed, servers):
+    api, client, ports = routed
+    primary, replica = servers
+    
+    response, port = request(api, client, ports, 'POST', 'create-chat', body={'type': 'private', 'member_ids': [2]})
+    assert (response['statusCode'], port) == (200, primary.port)
+    assert 'X-Primary-Until' in response['headers']
+    chat_id = decode_body(response)['chat']['id']
+    wait_for_replay(primary, replica)
+    
+    for path, params in (('chats', None), (f'messages/{chat_id}', None), ('search-users', {'q': 'bo'})):
+        response, port = request(api, client, ports, 'GET', path, params)
+        assert (path, response['statusCode'], port) == (path, 200, replica.port)
+        assert 'X-Primary-Until' not in response['headers']
+    
+    response, port = request(api, client, ports, 'GET', 'sync')
+    assert (response['statusCode'], port) == (200, primary.port)
+
+def test_reads_stay_on_primary_after_a_write(routed, servers):
+    api, client, ports = routed
+    primary, replica = servers
+    
+    response, _ = request(api, client, ports, 'POST', 'create-chat', body={'type': 'private', 'member_ids': [2]})
+    chat_id = decode_body(response)['chat']['id']
+    response, port = request(api, client, ports, 'POST', 'send', body={'chat_id': chat_id, 'text': 'Привет'})
+    assert (response['statusCode'], port) == (200, primary.port)
+    primary_until = response['headers']['X-Primary-Until']
+    
+    response, port = request(api, client, ports, 'GET', f'messages/{chat_id}', primary_until=primary_until)
+    assert (response['statusCode'], port) == (200, primary.port)
+    assert [message['text'] for message in decode_body(response)['messages']] == ['Привет']
+    
+    wait_for_replay(primary, replica)
+    for expired in (f'{time.time() - 1:.3f}', 'junk'):
+        response, port = request(api, client, ports, 'GET', f'messages/{chat_id}', primary_until=expired)
+        assert (expired, response['statusCode'], port) == (expired, 200, replica.port)
+
+def test_falls_back_to_primary_when_replica_fails(routed, servers):
+    api, client, ports = routed
+    primary, replica = servers
+    
+    response, port = request(api, client, ports, 'GET', 'chats')
+    assert (response['statusCode'], port) == (200, replica.port)
+    
+    subprocess.run(
+        [f'{replica.bin_dir}/pg_ctl', '-D', replica.data_dir, '-m', 'immediate', '-w', 'stop'],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    try:
+        response, port = request(api, client, ports, 'GET', 'chats')
+        assert response['statusCode'] == 200
+        assert ports[-2:] == [replica.port, primary.port], 'the pooled replica connection should fail over to the primary'
+        
+        response, port = request(api, client, ports, 'GET', 'chats')
+        assert (response['statusCode'], port) == (200, primary.port)
+    finally:
+        subprocess.run(
+            [f'{replica.bin_dir}/pg_ctl', '-D', replica.data_dir, '-o',
+             f'-p {replica.port} -k {replica.data_dir} -c listen_addresses=localhost',
+             '-l', f'{replica.data_dir}/server.log', '-w', 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
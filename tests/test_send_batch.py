@@ -0,0 +1,51 @@
+"""
+Пакетная отправка: неверный элемент получает ошибку в своём results[index] и не мешает остальным,
+а тело, которое не является JSON-объектом, отклоняется с 400 до обращения к БД
+"""
+import pytest
+
+from load_test import make_event, decode_body, response_queries
+
+@pytest.fixture
+def chat(call, create_users):
+    owner, member = create_users(2)
+    status, body = call(owner, 'POST', 'create-chat', body={'type': 'group', 'name': 'Группа', 'member_ids': [member.user_id]})
+    assert status == 200, body
+    return owner, body['chat']['id']
+
+@pytest.mark.parametrize('item, error', [
+    ({'chat_id': 'abc', 'text': 'Привет'}, 'chat_id must be an integer'),
+    ({'chat_id': 1.5, 'text': 'Привет'}, 'chat_id must be an integer'),
+    ({'chat_id': [1], 'text': 'Привет'}, 'chat_id must be an integer'),
+    ({'chat_id': True, 'text': 'Привет'}, 'chat_id must be an integer'),
+    ({'chat_id': 1, 'text': 42}, 'chat_id and text are required'),
+    ({'chat_id': 1, 'text': ['Привет']}, 'chat_id and text are required'),
+    ({'chat_id': 1, 'text': '   '}, 'chat_id and text are required'),
+    ({'chat_id': 1, 'text': 'Привет', 'message_type': ['text']}, 'Invalid message_type'),
+    ('Привет', 'chat_id and text are required'),
+])
+def test_invalid_item_reports_its_own_error(call, chat, item, error):
+    owner, chat_id = chat
+    status, body = call(owner, 'POST', 'send-batch', body={'messages': [item, {'chat_id': str(chat_id), 'text': 'Привет'}]})
+    
+    assert status == 200, body
+    assert body['results'][0] == {'index': 0, 'error': error}
+    assert body['results'][1]['message']['chat_id'] == chat_id
+
+def test_foreign_chat_is_denied(call, chat, create_users):
+    owner, chat_id = chat
+    stranger, = create_users(1)
+    status, body = call(stranger, 'POST', 'send-batch', body={'messages': [{'chat_id': chat_id, 'text': 'Привет'}]})
+    
+    assert status == 200, body
+    assert body['results'] == [{'index': 0, 'error': 'Access denied'}]
+
+@pytest.mark.parametrize('raw_body', ['{"messages": [', 'not json', '[1, 2]', '"Привет"'])
+def test_malformed_body_is_rejected(api, chat, raw_body):
+    owner, _ = chat
+    event = make_event(owner, 'POST', 'send-batch')
+    event['body'] = raw_body
+    response = api.handler(event, None)
+    
+    assert (response['statusCode'], decode_body(response)) == (400, {'error': 'Invalid JSON body'})
+    assert response_queries(response) == 0
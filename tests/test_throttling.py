@@ -0,0 +1,115 @@
+"""
+Ограничение частоты опросов и объединение запросов: пачки одновременных chats, messages и sync выполняются один раз на группу,
+а лимит пропускает ровно RATE_LIMIT_BURST запросов пользователя и отвечает 429 без запросов к БД (корзины в памяти и в БД)
+"""
+import threading
+import time
+
+import pytest
+
+from conftest import reset_db_pools
+from load_test import make_event, response_queries
+
+BURST_POOL_SIZE = 64
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_PER_SECOND = 0.01
+SLOW_EXECUTION_SECONDS = 0.05
+
+def send_burst(api, events):
+    responses = [None] * len(events)
+    barrier = threading.Barrier(len(events))
+    
+    def send(index, event):
+        barrier.wait()
+        responses[index] = api.handler(event, None)
+    
+    threads = [threading.Thread(target=send, args=(index, event)) for index, event in enumerate(events)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+@pytest.fixture
+def burst_api(api, monkeypatch):
+    import database
+    reset_db_pools()
+    monkeypatch.setattr(database, 'DB_POOL_MAX_SIZE', BURST_POOL_SIZE)
+    try:
+        yield api
+    finally:
+        reset_db_pools()
+
+@pytest.fixture
+def chatting_users(call, create_users):
+    def create(count: int):
+        clients = create_users(count + 1)
+        peer = clients[-1]
+        for client in clients[:-1]:
+            status, body = call(client, 'POST', 'create-chat', body={'type': 'private', 'member_ids': [peer.user_id]})
+            assert status == 200, body
+            client.chat_ids = [body['chat']['id']]
+            status, body = call(client, 'POST', 'send', body={'chat_id': client.chat_ids[0], 'text': 'Привет'})
+            assert status == 200, body
+        return clients[:-1]
+    
+    return create
+
+@pytest.fixture
+def rate_limit(monkeypatch, db):
+    import throttling
+    
+    def configure(store: str):
+        monkeypatch.setattr(throttling, 'RATE_LIMIT_STORE', store)
+        monkeypatch.setattr(throttling, 'RATE_LIMIT_BURST', RATE_LIMIT_BURST)
+        monkeypatch.setattr(throttling, 'RATE_LIMIT_PER_SECOND', RATE_LIMIT_PER_SECOND)
+        monkeypatch.setattr(throttling, '_buckets', {})
+        db.execute("TRUNCATE rate_limit_buckets")
+    
+    return configure
+
+def test_identical_concurrent_requests_run_once(burst_api, chatting_users, monkeypatch):
+    copies = 6
+    groups = []
+    for client in chatting_users(4):
+        for path, params in (('chats', {}), (f'messages/{client.chat_ids[0]}', {'limit': '50'}), ('sync', {})):
+            single = burst_api.handler(make_event(client, 'GET', path, params), None)
+            assert single['statusCode'] == 200, single
+            groups.append((client, path, params, response_queries(single)))
+    
+    execute_route = burst_api.execute_route
+    
+    def slowed(*args):
+        time.sleep(SLOW_EXECUTION_SECONDS)
+        return execute_route(*args)
+    
+    monkeypatch.setattr(burst_api, 'execute_route', slowed)
+    events = [make_event(client, 'GET', path, params) for client, path, params, _ in groups for _ in range(copies)]
+    responses = send_burst(burst_api, events)
+    
+    for index, (client, path, _, expected) in enumerate(groups):
+        group = responses[index * copies:(index + 1) * copies]
+        assert sum(response_queries(response) for response in group) == expected, (client.user_id, path)
+        assert len({(response['statusCode'], response['body']) for response in group}) == 1, (client.user_id, path)
+
+@pytest.mark.parametrize('store', ['memory', 'database'])
+def test_rate_limit_allows_burst_then_rejects(burst_api, chatting_users, rate_limit, store):
+    clients = chatting_users(4)
+    rate_limit(store)
+    requests_per_user = RATE_LIMIT_BURST * 2
+    events = [
+        (client, make_event(client, 'GET', f'messages/{client.chat_ids[0]}', {'limit': str(10 + i)}))
+        for client in clients for i in range(requests_per_user)
+    ]
+    responses = send_burst(burst_api, [event for _, event in events])
+    
+    statuses = {}
+    for (client, _), response in zip(events, responses):
+        counts = statuses.setdefault(client.user_id, {})
+        counts[response['statusCode']] = counts.get(response['statusCode'], 0) + 1
+        if response['statusCode'] == 429:
+            assert int(response['headers']['Retry-After']) >= 1
+            assert response_queries(response) == 0
+    
+    expected = {200: RATE_LIMIT_BURST, 429: requests_per_user - RATE_LIMIT_BURST}
+    assert statuses == {client.user_id: expected for client in clients}
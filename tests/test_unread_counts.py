@@ -0,0 +1,86 @@
+"""
+Свойство счётчиков непрочитанного: chat_members.unread_count после случайных send, send-batch, read, create-chat и add-members
+совпадает с подсчётом COUNT(*) по messages и read_messages, а reconcile_unread_counts восстанавливает испорченные счётчики
+"""
+import random
+import threading
+
+import pytest
+
+from conftest import RandomSession
+
+UNREAD_QUERY = """
+    SELECT cm.chat_id, cm.user_id, cm.unread_count, (
+        SELECT COUNT(*) FROM messages m
+        LEFT JOIN read_messages rm ON rm.chat_id = cm.chat_id AND rm.user_id = cm.user_id
+        WHERE m.chat_id = cm.chat_id AND m.sender_id != cm.user_id
+        AND (rm.last_read_message_id IS NULL OR m.id > rm.last_read_message_id)
+    ) as expected
+    FROM chat_members cm
+    ORDER BY cm.chat_id, cm.user_id
+"""
+
+def unread_mismatches(db):
+    db.execute(UNREAD_QUERY)
+    return [dict(row) for row in db.fetchall() if row['unread_count'] != row['expected']]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_maintained_counts_match_count_query(call, create_users, db, seed):
+    session = RandomSession(call, create_users(8), random.Random(seed))
+    
+    history = []
+    for _ in range(150):
+        history.append(session.step())
+        mismatches = unread_mismatches(db)
+        assert not mismatches, f'after {history[-1]} (operations so far: {history}): {mismatches}'
+        
+        if history[-1][0] == 'read' and history[-1][4] is not None:
+            _, user_id, chat_id, _, unread_count = history[-1]
+            db.execute("SELECT unread_count FROM chat_members WHERE chat_id = %s AND user_id = %s", (chat_id, user_id))
+            assert unread_count == db.fetchone()['unread_count']
+
+@pytest.mark.parametrize('seed', range(3))
+def test_reconcile_restores_counts(api, call, create_users, db, seed):
+    clients = create_users(8)
+    session = RandomSession(call, clients, random.Random(seed))
+    for _ in range(100):
+        session.step()
+    
+    db.execute("SELECT setseed(%s)", (seed / 10,))
+    db.execute("UPDATE chat_members SET unread_count = floor(random() * 20)::integer")
+    user_id = clients[0].user_id
+    
+    api.reconcile_unread_counts(db, user_id)
+    mismatches = unread_mismatches(db)
+    assert not [row for row in mismatches if row['user_id'] == user_id]
+    assert any(row['user_id'] != user_id for row in mismatches)
+    
+    api.reconcile_unread_counts(db)
+    assert not unread_mismatches(db)
+    assert api.reconcile_unread_counts(db) == 0
+
+def test_concurrent_writers_keep_counts(call, create_users, db):
+    clients = create_users(6)
+    setup = RandomSession(call, clients, random.Random(0))
+    for _ in range(4):
+        setup.create_chat()
+    
+    errors = []
+    
+    def worker(seed: int):
+        session = RandomSession(call, clients, random.Random(seed))
+        session.chat_ids = list(setup.chat_ids)
+        try:
+            for _ in range(60):
+                session.step()
+        except AssertionError as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert not unread_mismatches(db)